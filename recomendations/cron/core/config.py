@@ -16,6 +16,8 @@ class Settings(BaseSettings):
     recommendations_endpoint: str = Field(default="/api/v1/recommendations/create_matrices")
     recommendations_host: str = Field(default="localhost")
     recommendations_port: str = Field(default="80")
+    # Сколько секунд повторять запуск обновления при ошибках
+    max_retry_time: int = Field(default=600)
 
     cron_logfile: str = Field(default="/usr/src/cron/logs/cron.log")
 
@@ -7,17 +7,21 @@ from core.config import settings
 
 @backoff.on_exception(backoff.expo,
                       requests.RequestException,
-                      max_time=86400,
+                      max_time=settings.max_retry_time,
                       logger=logger)
 def get_data(endpoint):
     """Выполнение эндпоинтов"""
 
     response = requests.get(endpoint, timeout=5)
     response.raise_for_status()  # Бросит исключение для статусов 4xx и 5xx
+    return response.json()
 
 
 if __name__ == '__main__':
     logger.info('START')
     url = f'http://{settings.recommendations_host}:{settings.recommendations_port}{settings.recommendations_endpoint}'
-    get_data(url)
+    # Эндпоинт только ставит обновление матриц в очередь (или возвращает
+    # уже выполняемое обновление), поэтому не ждем его завершения
+    job = get_data(url)
+    logger.info(f'JOB {job["job_id"]}: {job["status"]}')
     logger.info('FINISH')
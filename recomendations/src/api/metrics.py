@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends
+
+from core.models import Metrics
+from services import metrics
+from services.film_cache import film_cache
+from services.metrics import serving_metrics
+from services.refresh_jobs import (
+    RefreshJobsService,
+    get_refresh_jobs_service,
+)
+
+router = APIRouter()
+
+
+@router.get("", summary="Метрики обновления матриц и обслуживания запросов.")
+async def get_metrics(
+    refresh_jobs_service: RefreshJobsService = Depends(
+        get_refresh_jobs_service
+    ),
+) -> Metrics:
+    # показатели этапов последнего обновления общие для всех воркеров,
+    # гистограммы задержек, кэш фильмов и память -- этого воркера
+    return Metrics(
+        refresh=await refresh_jobs_service.get_last_job(),
+        serving=serving_metrics.to_dict(),
+        film_cache=film_cache.to_dict(),
+        peak_rss=metrics.peak_rss(),
+        worker_peak_rss=metrics.worker_peak_rss,
+    )
@@ -1,23 +1,70 @@
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
+from fastapi.responses import StreamingResponse
 
-from core.models import FilmShort
+from core.config import settings
+from core.exceptions import RefreshJobNotFoundException
+from core.models import FilmShort, RefreshJob
 from services.recommendations import (
     RecommendationsService,
     get_recommendations_service,
 )
+from services.refresh_jobs import (
+    RefreshJobsService,
+    get_refresh_jobs_service,
+)
 
 router = APIRouter()
 
 
 @router.get("/create_matrices", summary="Создание и обновление матриц.")
 async def create_matrices(
+    refresh_jobs_service: RefreshJobsService = Depends(
+        get_refresh_jobs_service
+    ),
+) -> RefreshJob:
+    # обновление выполняется в фоне; если оно уже идет, возвращается
+    # выполняемая задача
+    return await refresh_jobs_service.start_job()
+
+
+@router.get(
+    "/refresh_jobs/{job_id}",
+    summary="Состояние задачи обновления матриц.",
+)
+async def get_refresh_job(
+    job_id: str,
+    refresh_jobs_service: RefreshJobsService = Depends(
+        get_refresh_jobs_service
+    ),
+) -> RefreshJob:
+    job = await refresh_jobs_service.get_job(job_id)
+    if job is None:
+        raise RefreshJobNotFoundException
+    return job
+
+
+@router.post(
+    "/batch",
+    summary="Получение рекомендаций для группы пользователей (NDJSON).",
+)
+async def get_batch_recommendations(
+    user_ids: Annotated[
+        list[UUID], Body(min_length=1, max_length=settings.batch_max_users)
+    ],
     recommendations_service: RecommendationsService = Depends(
         get_recommendations_service
     ),
-) -> None:
-    await recommendations_service.refresh_matrices()
+):
+    # строка {"user_id": ..., "movies": [...]} на каждого пользователя
+    return StreamingResponse(
+        recommendations_service.stream_batch_recommendations(
+            [str(user_id) for user_id in user_ids]
+        ),
+        media_type="application/x-ndjson",
+    )
 
 
 @router.get("/{user_id}", summary="Получение списка рекоммендаций.")
@@ -0,0 +1,94 @@
+"""Бенчмарк точного и приближенного поиска top-k соседей.
+
+Сравнивает ``top_k_cosine_neighbours`` и ``approximate_top_k_neighbours``
+по времени на синтетической матрице, в которой пользователи делятся на
+группы со своими любимыми фильмами, а остальные оценки распределены по
+популярности (степенной закон). Качество приближенного поиска --
+recall@K по сравнению с точным.
+
+Запуск из каталога ``recomendations/src``::
+
+    python -m benchmarks.neighbours --users 50000 --movies 5000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from services.similarity import (
+    approximate_top_k_neighbours,
+    neighbour_recall,
+    top_k_cosine_neighbours,
+)
+
+
+def make_ratings(args) -> csr_matrix:
+    """Синтетическая матрица: половина оценок пользователя -- фильмы его
+    группы, половина -- популярные фильмы."""
+    rng = np.random.default_rng(args.seed)
+    popularity = 1 / np.arange(1, args.movies + 1) ** 0.8
+    popularity /= popularity.sum()
+    favourites = rng.integers(args.movies, size=(args.groups, 200))
+    counts = np.minimum(rng.pareto(1.5, args.users) * 10 + 3, 300).astype(int)
+    groups = rng.integers(args.groups, size=args.users)
+    rows, columns = [], []
+    for user, (count, group) in enumerate(zip(counts, groups)):
+        movies = np.unique(
+            np.concatenate(
+                [
+                    rng.choice(favourites[group], count // 2 + 1),
+                    rng.choice(args.movies, count // 2 + 1, p=popularity),
+                ]
+            )
+        )
+        rows.append(np.full(len(movies), user))
+        columns.append(movies)
+    rows = np.concatenate(rows)
+    return csr_matrix(
+        (
+            rng.integers(1, 11, len(rows)).astype(np.float64),
+            (rows, np.concatenate(columns)),
+        ),
+        shape=(args.users, args.movies),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--lists", type=int, default=0)
+    parser.add_argument("--probes", type=int, default=16)
+    parser.add_argument("--recall-sample", type=int, default=500)
+    parser.add_argument("--skip-exact", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ratings = make_ratings(args)
+    print(f"матрица: {args.users}x{args.movies}, nnz={ratings.nnz}")
+
+    started = time.perf_counter()
+    neighbours, weights = approximate_top_k_neighbours(
+        ratings,
+        args.top_k,
+        args.block_size,
+        lists=args.lists,
+        probes=args.probes,
+    )
+    approximate_time = time.perf_counter() - started
+    recall = neighbour_recall(
+        ratings, neighbours, weights, args.recall_sample, args.block_size
+    )
+    print(f"приближенный: {approximate_time:.2f} с")
+    print(f"recall@{args.top_k}:    {recall:.3f}")
+    if not args.skip_exact:
+        started = time.perf_counter()
+        top_k_cosine_neighbours(ratings, args.top_k, args.block_size)
+        exact_time = time.perf_counter() - started
+        print(f"точный:       {exact_time:.2f} с")
+        print(f"ускорение:    {exact_time / approximate_time:.1f}x")
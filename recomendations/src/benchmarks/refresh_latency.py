@@ -0,0 +1,119 @@
+"""Задержка обслуживания запросов во время обновления матриц.
+
+Запросы рекомендаций (``score_user`` по снимку матриц) выполняются
+в цикле событий с постоянной частотой, параллельно идет построение
+модели и документов коллекций. Сравниваются расчет прямо в цикле
+событий и расчет в пуле процессов через ``run_cpu_bound``.
+
+Запуск из каталога ``recomendations/src``::
+
+    python -m benchmarks.refresh_latency --users 20000 --movies 3000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from services import training
+from services.matrix import RatingTriples
+from services.scoring import score_user
+
+
+def make_triples(args) -> RatingTriples:
+    """Синтетические оценки: у каждого пользователя ``--per-user`` фильмов."""
+    rng = np.random.default_rng(args.seed)
+    triples = RatingTriples()
+    for user in range(args.users):
+        movies = rng.choice(args.movies, args.per_user, replace=False)
+        for movie, rating in zip(movies, rng.integers(1, 11, args.per_user)):
+            triples.append(f"u{user}", f"m{movie}", float(rating))
+    return triples
+
+
+async def refresh(triples: RatingTriples, args, in_pool: bool) -> float:
+    """Построение модели и документов коллекций; время выполнения."""
+    started = time.perf_counter()
+    if in_pool:
+        model = await training.run_cpu_bound(
+            training.build_model, triples, args.top_k, args.block_size
+        )
+        await training.run_cpu_bound(training.build_records, model)
+    else:
+        model = training.build_model(triples, args.top_k, args.block_size)
+        training.build_records(model)
+    return time.perf_counter() - started
+
+
+async def serve(model, args, stop: asyncio.Event) -> list[float]:
+    """Запросы с интервалом ``--interval``; задержка каждого от плана."""
+    rating_matrix, arrays = model
+    neighbours, weights = arrays["neighbours"], arrays["neighbour_weights"]
+    rng = np.random.default_rng(args.seed)
+    latencies = []
+    interval = args.interval / 1000
+    planned = time.perf_counter()
+    while not stop.is_set():
+        planned += interval
+        await asyncio.sleep(max(planned - time.perf_counter(), 0))
+        user_row = int(rng.integers(rating_matrix.shape[0]))
+        score_user(
+            rating_matrix.ratings,
+            user_row,
+            neighbours[user_row, :20],
+            weights[user_row, :20],
+            10,
+        )
+        latencies.append(time.perf_counter() - planned)
+    return latencies
+
+
+async def run(triples, model, args, in_pool: bool) -> None:
+    stop = asyncio.Event()
+    serving = asyncio.create_task(serve(model, args, stop))
+    # даем запросам начаться до обновления
+    await asyncio.sleep(0.1)
+    refresh_time = await refresh(triples, args, in_pool)
+    stop.set()
+    latencies = np.array(await serving) * 1000
+    name = "пул процессов" if in_pool else "цикл событий"
+    print(
+        f"{name:>14}: обновление {refresh_time:.2f} с, "
+        f"запросов {len(latencies)}, "
+        f"p50 {np.percentile(latencies, 50):.1f} мс, "
+        f"p99 {np.percentile(latencies, 99):.1f} мс, "
+        f"max {latencies.max():.1f} мс"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--movies", type=int, default=3000)
+    parser.add_argument("--per-user", type=int, default=30)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="интервал между запросами, мс",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    triples = make_triples(args)
+    model = training.build_model(triples, args.top_k, args.block_size)
+    print(
+        f"матрица: {model[0].shape[0]}x{model[0].shape[1]}, "
+        f"nnz={model[0].nnz}"
+    )
+    asyncio.run(run(triples, model, args, in_pool=False))
+    training.executor = ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    )
+    asyncio.run(run(triples, model, args, in_pool=True))
+    training.executor.shutdown()
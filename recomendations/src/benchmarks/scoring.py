@@ -0,0 +1,107 @@
+"""Микро-бенчмарк расчета рекомендаций по соседям пользователя.
+
+Сравнивает прежний построчный цикл с накоплением в defaultdict и
+векторизованный ``score_user`` на синтетической матрице и проверяет,
+что оба дают одинаковое ранжирование. Отдельно измеряется пакетный
+``score_users`` блоками по ``--batch-size`` запросов.
+
+Запуск из каталога ``recomendations/src``::
+
+    python -m benchmarks.scoring --users 20000 --movies 5000
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+from services.scoring import score_user, score_users
+
+
+def score_user_loop(ratings, user_row, neighbours, weights, top_n):
+    """Прежний алгоритм: цикл по фильмам каждого соседа."""
+    seen_movies = set(ratings[user_row].indices)
+    recommended_movies = defaultdict(float)
+    for other_user, similarity in zip(neighbours, weights):
+        other_row = ratings[other_user]
+        for movie, rating in zip(other_row.indices, other_row.data):
+            if movie not in seen_movies:
+                recommended_movies[movie] += similarity * rating
+    recommended_movies_sorted = sorted(
+        recommended_movies.items(), key=lambda x: x[1], reverse=True
+    )
+    return [movie for movie, _ in recommended_movies_sorted][:top_n]
+
+
+def measure(func, ratings, cases, top_n) -> tuple[float, list]:
+    """Среднее время на запрос и результаты для каждого случая."""
+    results = []
+    started = time.perf_counter()
+    for user_row, neighbours, weights in cases:
+        result = func(ratings, user_row, neighbours, weights, top_n)
+        results.append(list(result))
+    return (time.perf_counter() - started) / len(cases), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--density", type=float, default=0.01)
+    parser.add_argument("--neighbours", type=int, default=20)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ratings = sparse_random(
+        args.users,
+        args.movies,
+        density=args.density,
+        format="csr",
+        random_state=args.seed,
+        data_rvs=lambda size: rng.integers(1, 11, size),
+    )
+    cases = []
+    for _ in range(args.requests):
+        user_row = int(rng.integers(args.users))
+        neighbours = rng.choice(args.users, args.neighbours, replace=False)
+        weights = np.sort(rng.random(args.neighbours))[::-1]
+        cases.append((user_row, neighbours, weights))
+
+    loop_time, loop_result = measure(
+        score_user_loop, ratings, cases, args.top_n
+    )
+    vector_time, vector_result = measure(
+        score_user, ratings, cases, args.top_n
+    )
+
+    started = time.perf_counter()
+    batch_result = []
+    for start in range(0, len(cases), args.batch_size):
+        block = cases[start : start + args.batch_size]
+        batch_result.extend(
+            score_users(
+                ratings,
+                np.array([user_row for user_row, _, _ in block]),
+                np.array([neighbours for _, neighbours, _ in block]),
+                np.array([weights for _, _, weights in block]),
+                args.top_n,
+            )
+        )
+    batch_time = (time.perf_counter() - started) / len(cases)
+
+    print(f"матрица: {args.users}x{args.movies}, nnz={ratings.nnz}")
+    print(f"цикл:            {loop_time * 1000:.3f} мс/запрос")
+    print(f"векторизованный: {vector_time * 1000:.3f} мс/запрос")
+    print(f"ускорение:       {loop_time / vector_time:.1f}x")
+    print(f"пакетный:        {batch_time * 1000:.3f} мс/запрос")
+    print(f"ранжирование совпадает: {loop_result == vector_result}")
+    print(
+        "пакетное ранжирование совпадает: "
+        f"{[list(result) for result in batch_result] == vector_result}"
+    )
@@ -0,0 +1,297 @@
+"""Сквозной бенчмарк сервиса рекомендаций на синтетических данных.
+
+Генерирует лайки со степенным распределением (``benchmarks.synthetic``),
+поднимает локальные заменители UGC и Movies и хранилище в памяти вместо
+Mongo и прогоняет через ``RecommendationsService``:
+
+* ``refresh_matrices`` -- длительность, пиковый RSS и показатели
+  каждого этапа, пропускная способность (лайков в секунду);
+* загрузку снимка матриц с диска и из коллекций;
+* ``get_recommendations`` -- задержки p50/p95/p99 и запросов в секунду
+  при ``--concurrency`` одновременных запросах;
+* ``stream_batch_recommendations`` -- пользователей в секунду.
+
+Результаты можно сохранить (``--json``) и сравнить с сохраненными ранее
+(``--baseline``): при замедлении больше ``--tolerance`` бенчмарк
+завершается с кодом 1.
+
+Запуск из каталога ``recomendations/src``::
+
+    python -m benchmarks.service --users 50000 --movies 10000 \\
+        --likes 1000000 --json result.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from aiohttp import ClientSession
+
+from benchmarks.synthetic import (
+    MemoryStorage,
+    StandInServer,
+    make_dataset,
+)
+from core.config import settings
+from services import metrics, training
+from services.progress import RefreshProgress
+from services.recommendations import RecommendationsService
+from services.snapshot import snapshot_holder
+
+# Показатели, по которым сравнение с --baseline: больше -- хуже
+LOWER_IS_BETTER = (
+    "refresh_seconds",
+    "snapshot_disk_seconds",
+    "snapshot_mongo_seconds",
+    "latency_p50_ms",
+    "latency_p95_ms",
+    "latency_p99_ms",
+    "peak_rss_mb",
+    "serving_peak_rss_mb",
+)
+# меньше -- хуже
+HIGHER_IS_BETTER = (
+    "likes_per_second",
+    "requests_per_second",
+    "batch_users_per_second",
+)
+
+
+def make_service(database: dict, session: ClientSession):
+    collections = {
+        name: MemoryStorage.create(database, name)
+        for name in (
+            "user_movie_collection",
+            "similarity_collection",
+            "movie_similarity_collection",
+            "model_factors_collection",
+            "new_movies_collection",
+            "version_collection",
+            "user_recommendations_collection",
+        )
+    }
+    return RecommendationsService(http_session=session, **collections)
+
+
+async def load_snapshot(service: RecommendationsService) -> float:
+    """Загрузка снимка матриц заново (без кэша процесса); время."""
+    snapshot_holder.snapshot = None
+    started = time.perf_counter()
+    await service._get_snapshot()
+    return time.perf_counter() - started
+
+
+async def serve(
+    service: RecommendationsService, users: list[str], concurrency: int
+) -> tuple[np.ndarray, float]:
+    """Запросы рекомендаций ``users`` в ``concurrency`` потоков;
+    задержки каждого запроса и общее время."""
+    queue = iter(users)
+    latencies = []
+
+    async def worker() -> None:
+        for user_id in queue:
+            started = time.perf_counter()
+            await service.get_recommendations(user_id)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return np.array(latencies), time.perf_counter() - started
+
+
+async def run(args) -> dict:
+    dataset = make_dataset(
+        args.users,
+        args.movies,
+        args.likes,
+        new_movies=args.new_movies,
+        user_exponent=args.user_exponent,
+        movie_exponent=args.movie_exponent,
+        seed=args.seed,
+    )
+    server = StandInServer(dataset)
+    await server.start()
+    settings.ugc_movies_endpoint = f"{server.base_url}/ugc"
+    settings.movies_uuid_endpoint = f"{server.base_url}/movies/all"
+    settings.movies_endpoint = f"{server.base_url}/movies"
+    settings.serving_metrics_sample_rate = 1.0
+    result = {}
+    try:
+        async with ClientSession() as session:
+            service = make_service({}, session)
+
+            progress = RefreshProgress()
+            started = time.perf_counter()
+            await service.refresh_matrices(progress)
+            refresh_seconds = time.perf_counter() - started
+            result["refresh_seconds"] = round(refresh_seconds, 3)
+            result["likes_per_second"] = round(args.likes / refresh_seconds)
+            result["stages"] = progress.metrics
+
+            result["snapshot_disk_seconds"] = round(
+                await load_snapshot(service), 3
+            )
+            settings.snapshot_dir = tempfile.mkdtemp()
+            result["snapshot_mongo_seconds"] = round(
+                await load_snapshot(service), 3
+            )
+
+            rng = np.random.default_rng(args.seed)
+            users = rng.choice(dataset.users, args.requests).tolist()
+            metrics.reset_peak_rss()
+            latencies, seconds = await serve(service, users, args.concurrency)
+            latencies *= 1000
+            for percentile in (50, 95, 99):
+                result[f"latency_p{percentile}_ms"] = round(
+                    float(np.percentile(latencies, percentile)), 3
+                )
+            result["requests_per_second"] = round(len(latencies) / seconds)
+
+            started = time.perf_counter()
+            for start in range(0, len(users), args.batch_size):
+                async for _ in service.stream_batch_recommendations(
+                    users[start : start + args.batch_size]
+                ):
+                    pass
+            result["batch_users_per_second"] = round(
+                len(users) / (time.perf_counter() - started)
+            )
+            result["serving"] = {
+                name: round(histogram.total / histogram.count * 1000, 3)
+                for name, histogram in sorted(
+                    metrics.serving_metrics.histograms.items()
+                )
+            }
+            result["serving_peak_rss_mb"] = round(
+                metrics.peak_rss() / 2**20, 1
+            )
+    finally:
+        await server.stop()
+    total = result["stages"]["total"]
+    result["peak_rss_mb"] = round(total["peak_rss"] / 2**20, 1)
+    result["worker_peak_rss_mb"] = round(total["worker_peak_rss"] / 2**20, 1)
+    return result
+
+
+def report(result: dict) -> None:
+    print("обновление матриц:")
+    for stage, values in result["stages"].items():
+        if stage == "total":
+            continue
+        counters = ", ".join(
+            f"{name}={value}"
+            for name, value in values.items()
+            if name not in ("seconds", "peak_rss", "worker_peak_rss")
+        )
+        print(
+            f"  {stage:>20}: {values['seconds']:8.3f} с, "
+            f"RSS {values['peak_rss'] / 2**20:8.1f} МБ, "
+            f"пул {values['worker_peak_rss'] / 2**20:8.1f} МБ  {counters}"
+        )
+    print(
+        f"  {'всего':>20}: {result['refresh_seconds']:8.3f} с, "
+        f"{result['likes_per_second']} лайков/с"
+    )
+    print(
+        f"снимок: с диска {result['snapshot_disk_seconds']:.3f} с, "
+        f"из коллекций {result['snapshot_mongo_seconds']:.3f} с"
+    )
+    print(
+        f"запросы: p50 {result['latency_p50_ms']:.2f} мс, "
+        f"p95 {result['latency_p95_ms']:.2f} мс, "
+        f"p99 {result['latency_p99_ms']:.2f} мс, "
+        f"{result['requests_per_second']} запросов/с"
+    )
+    print(f"группы: {result['batch_users_per_second']} пользователей/с")
+    print("этапы запросов (среднее, мс):")
+    for name, value in result["serving"].items():
+        print(f"  {name:>28}: {value:8.3f}")
+    print(
+        f"пиковый RSS обновления: {result['peak_rss_mb']} МБ, "
+        f"пула: {result['worker_peak_rss_mb']} МБ, "
+        f"запросов: {result['serving_peak_rss_mb']} МБ"
+    )
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list:
+    """Показатели, которые хуже ``baseline`` больше чем на ``tolerance``."""
+    found = []
+    for name in LOWER_IS_BETTER:
+        if name in baseline and result[name] > baseline[name] * (
+            1 + tolerance
+        ):
+            found.append((name, baseline[name], result[name]))
+    for name in HIGHER_IS_BETTER:
+        if name in baseline and result[name] < baseline[name] * (
+            1 - tolerance
+        ):
+            found.append((name, baseline[name], result[name]))
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--likes", type=int, default=1000000)
+    parser.add_argument("--new-movies", type=int, default=100)
+    parser.add_argument("--user-exponent", type=float, default=0.8)
+    parser.add_argument("--movie-exponent", type=float, default=1.0)
+    parser.add_argument(
+        "--engine",
+        default=settings.recommendations_engine,
+        choices=("user_user", "item_item", "als"),
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="процессов пула обновления (0 -- без пула)",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="файл для сохранения результатов")
+    parser.add_argument("--baseline", help="результаты для сравнения")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="допустимое ухудшение, доля",
+    )
+    args = parser.parse_args()
+
+    settings.recommendations_engine = args.engine
+    settings.precompute_recommendations = False
+    settings.incremental_refresh = False
+    settings.snapshot_dir = tempfile.mkdtemp()
+    if args.workers:
+        training.executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if training.executor is not None:
+            training.executor.shutdown()
+    result["params"] = vars(args)
+    report(result)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(result, json.load(file), args.tolerance)
+        for name, expected, actual in found:
+            print(f"регрессия {name}: {expected} -> {actual}")
+        if found:
+            sys.exit(1)
@@ -0,0 +1,62 @@
+"""Время запуска и память воркера сервиса рекомендаций.
+
+Импортирует приложение (``main``) в ``--runs`` новых процессах, как это
+делает каждый воркер uvicorn, и выводит время импорта, пиковый RSS
+процесса и тяжелые модули обучения модели, загруженные при старте (их
+быть не должно: они нужны только при обновлении матриц).
+
+Запуск из каталога ``recomendations/src``::
+
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+# Модули, нужные только для обучения модели
+TRAINING_MODULES = ("sklearn", "pandas", "scipy.linalg", "scipy.sparse.linalg")
+
+MEASURE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+seconds = time.perf_counter() - started
+print(json.dumps({
+    "seconds": seconds,
+    "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "modules": len(sys.modules),
+    "training": [name for name in %r if name in sys.modules],
+}))
+""" % (TRAINING_MODULES,)
+
+
+def measure() -> dict:
+    """Замер импорта приложения в новом процессе."""
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    seconds = np.array([run["seconds"] for run in runs])
+    rss = np.array([run["rss"] for run in runs]) / 2**20
+    print(
+        f"импорт main: медиана {np.median(seconds):.2f} с, "
+        f"min {seconds.min():.2f} с"
+    )
+    print(f"пиковый RSS: {np.median(rss):.0f} МБ")
+    print(f"модулей:     {runs[-1]['modules']}")
+    print(f"модули обучения при старте: {runs[-1]['training'] or 'нет'}")
@@ -0,0 +1,266 @@
+"""Синтетические данные и локальные заменители внешних сервисов.
+
+``make_dataset`` генерирует воспроизводимые (по ``seed``) лайки со
+степенным распределением активности пользователей и популярности
+фильмов. ``MemoryStorage`` -- хранилище в памяти процесса с интерфейсом
+``AbstractStorage`` вместо Mongo, ``StandInServer`` -- локальный
+HTTP-сервер, отвечающий как UGC (поток лайков) и Movies (UUID и данные
+фильмов).
+"""
+
+import json
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+import bson
+import numpy as np
+from aiohttp import web
+from bson.raw_bson import RawBSONDocument
+
+from services.mongo_storage import AbstractStorage
+
+# Время последнего изменения лайков всех сгенерированных фильмов
+LIKES_UPDATED_AT = "2024-01-01T00:00:00"
+
+
+@dataclass
+class Dataset:
+    """Сгенерированные данные.
+
+    ``users`` и ``movies`` -- UUID пользователей и фильмов каталога
+    Movies; лайки есть только у первых ``rated_movies`` фильмов, у
+    остальных (новинок) лайков нет. ``likes_ndjson`` -- ответ UGC.
+    """
+
+    users: list[str]
+    movies: list[str]
+    rated_movies: int
+    likes: int
+    likes_ndjson: bytes
+
+
+def power_law(size: int, exponent: float) -> np.ndarray:
+    """Вероятности ``1 / rank^exponent`` для ``size`` элементов."""
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_dataset(
+    users: int,
+    movies: int,
+    likes: int,
+    new_movies: int = 0,
+    user_exponent: float = 0.8,
+    movie_exponent: float = 1.0,
+    seed: int = 42,
+) -> Dataset:
+    """Лайки ``likes`` пар (пользователь, фильм) с рейтингом 1..10.
+
+    Пользователь и фильм каждого лайка выбираются независимо по
+    степенным распределениям: несколько пользователей и фильмов
+    получают большую часть лайков, как в реальных данных. Повторные
+    пары сохраняются (UGC их тоже может вернуть).
+
+    :param users: int - количество пользователей
+    :param movies: int - количество фильмов с лайками
+    :param likes: int - количество лайков
+    :param new_movies: int - фильмов каталога без лайков
+    :param user_exponent: float - показатель распределения активности
+    :param movie_exponent: float - показатель распределения популярности
+    :param seed: int - начальное значение генератора
+    """
+    rng = np.random.default_rng(seed)
+    # порядок рангов перемешан, чтобы активность не зависела от id
+    user_ranks = rng.permutation(users)
+    movie_ranks = rng.permutation(movies)
+    like_users = user_ranks[
+        rng.choice(users, likes, p=power_law(users, user_exponent))
+    ]
+    like_movies = movie_ranks[
+        rng.choice(movies, likes, p=power_law(movies, movie_exponent))
+    ]
+    ratings = rng.integers(1, 11, likes)
+
+    user_ids = [str(uuid.UUID(int=(1 << 64) + user)) for user in range(users)]
+    movie_ids = [
+        str(uuid.UUID(int=(2 << 64) + movie))
+        for movie in range(movies + new_movies)
+    ]
+    # лайки по фильмам: строка NDJSON на фильм, как отдает UGC
+    order = np.argsort(like_movies, kind="stable")
+    bounds = np.searchsorted(like_movies[order], np.arange(movies + 1))
+    lines = []
+    for movie in range(movies):
+        positions = order[bounds[movie] : bounds[movie + 1]]
+        lines.append(
+            json.dumps(
+                {
+                    "_id": movie_ids[movie],
+                    "likes": [
+                        {"user_id": user_ids[user], "rating": int(rating)}
+                        for user, rating in zip(
+                            like_users[positions].tolist(),
+                            ratings[positions].tolist(),
+                        )
+                    ],
+                    "likes_updated_at": LIKES_UPDATED_AT,
+                }
+            )
+        )
+    return Dataset(
+        users=user_ids,
+        movies=movie_ids,
+        rated_movies=movies,
+        likes=likes,
+        likes_ndjson=("\n".join(lines) + "\n").encode(),
+    )
+
+
+class MemoryCollection:
+    """Коллекция в памяти: документы по ``_id``."""
+
+    def __init__(self, database: dict, name: str) -> None:
+        self.database = database
+        self.name = name
+        self.documents: dict[Any, dict] = database.setdefault(name, {})
+
+
+class MemoryStorage(AbstractStorage):
+    """Хранилище в памяти процесса вместо Mongo.
+
+    Поддерживает то, что использует ``RecommendationsService``: поиск
+    по ``_id``, ``$set`` и версионированные коллекции. Документы,
+    переданные как BSON, разбираются один раз при записи.
+    """
+
+    @classmethod
+    def create(cls, database: dict, name: str) -> "MemoryStorage":
+        return cls(collection=MemoryCollection(database, name))
+
+    async def get_list(self) -> list[dict]:
+        return [
+            dict(document) for document in self.collection.documents.values()
+        ]
+
+    async def get_by_id(
+        self, filters: dict, projection: dict | None = None
+    ) -> dict | None:
+        document = self.collection.documents.get(filters["_id"])
+        return dict(document) if document is not None else None
+
+    async def insert_many(self, data: list[dict]) -> None:
+        for document in data:
+            if isinstance(document, RawBSONDocument):
+                document = bson.decode(document.raw)
+            self.collection.documents[document["_id"]] = document
+
+    async def upsert_one(self, filters: dict, data: dict) -> None:
+        document = self.collection.documents.setdefault(
+            filters["_id"], {"_id": filters["_id"]}
+        )
+        document.update(data.get("$set", {}))
+
+    async def update_one(self, filters: dict, data: dict) -> None:
+        document = self.collection.documents.get(filters["_id"])
+        if document is not None:
+            document.update(data.get("$set", {}))
+
+    async def find_one_and_upsert(
+        self, filters: dict, data: dict
+    ) -> dict | None:
+        await self.upsert_one(filters, data)
+        return await self.get_by_id(filters)
+
+    async def delete_all(self) -> None:
+        self.collection.documents.clear()
+
+    def versioned(self, version: str | None) -> "MemoryStorage":
+        if version is None:
+            return self
+        return self.create(
+            self.collection.database, f"{self.collection.name}_{version}"
+        )
+
+    async def list_versions(self) -> list[str]:
+        prefix = f"{self.collection.name}_"
+        return [
+            name[len(prefix) :]
+            for name in self.collection.database
+            if name.startswith(prefix)
+        ]
+
+    async def drop(self) -> None:
+        self.collection.database.pop(self.collection.name, None)
+        self.collection.documents = {}
+
+    async def distinct(self, field: str) -> list[Any]:
+        return sorted(
+            {
+                document[field]
+                for document in self.collection.documents.values()
+            }
+        )
+
+
+class StandInServer:
+    """Локальный HTTP-сервер вместо UGC и Movies.
+
+    ``/ugc/likes`` (ugc_likes_endpoint) отдает лайки потоком NDJSON,
+    ``/movies/all`` -- UUID всех фильмов, ``POST /movies`` -- данные
+    запрошенных фильмов.
+    """
+
+    def __init__(self, dataset: Dataset, chunk_size: int = 64 * 1024):
+        self.dataset = dataset
+        self.chunk_size = chunk_size
+        self.port: int | None = None
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/ugc/likes", self._likes)
+        app.router.add_get("/movies/all", self._all_movies)
+        app.router.add_post("/movies", self._movies)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _likes(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        await response.prepare(request)
+        # изменений после LIKES_UPDATED_AT нет
+        if request.query.get("updated_since", "") < LIKES_UPDATED_AT:
+            body = self.dataset.likes_ndjson
+            for start in range(0, len(body), self.chunk_size):
+                await response.write(body[start : start + self.chunk_size])
+        await response.write_eof()
+        return response
+
+    async def _all_movies(self, request: web.Request) -> web.Response:
+        return web.json_response(self.dataset.movies)
+
+    async def _movies(self, request: web.Request) -> web.Response:
+        movies_uuid = await request.json()
+        return web.json_response(
+            [
+                {
+                    "uuid": movie_uuid,
+                    "title": movie_uuid[-6:],
+                    "imdb_rating": 5,
+                }
+                for movie_uuid in movies_uuid
+            ]
+        )
@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -7,6 +8,9 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENV_PATH = os.path.join(os.path.dirname(BASE_DIR), ".env")
 
+# Алгоритмы расчета рекомендаций
+Engine = Literal["user_user", "item_item", "als"]
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -25,10 +29,95 @@ class Settings(BaseSettings):
     mongo_db_name: str = Field(default="movie_recommender")
 
     num_recommendations: int = 10
+    # Алгоритм рекомендаций: user_user -- по похожим пользователям,
+    # item_item -- по фильмам, похожим на оцененные пользователем
+    # (каталог фильмов меньше и стабильнее числа пользователей), als --
+    # по латентным факторам неявной матричной факторизации
+    recommendations_engine: Engine = "user_user"
     num_similar_users: int = 20
+    # Сколько соседей хранить для каждого пользователя в user_similarity
+    # (0 -- хранить всех пользователей)
+    similarity_top_k: int = 100
+    # Сколько похожих фильмов хранить для каждого фильма в
+    # movie_similarity (item_item; 0 -- хранить все фильмы)
+    movie_similarity_top_k: int = 50
+    # ALS: размерность факторов, количество итераций, коэффициент
+    # регуляризации и рост уверенности в оценке с рейтингом
+    als_factors: int = 64
+    als_iterations: int = 15
+    als_regularization: float = 0.1
+    als_alpha: float = 2.0
+    # Поиск соседей: exact -- точный, approximate -- приближенный по
+    # кластерам строк (субквадратичный); для матриц меньше
+    # approximate_min_rows строк поиск всегда точный. Приближенный поиск
+    # быстрее точного только при невысоком recall (около 0.6 при 16
+    # кластерах из ~200), поэтому по умолчанию выключен
+    similarity_index: Literal["exact", "approximate"] = "exact"
+    approximate_min_rows: int = 20000
+    # Приближенный поиск: количество кластеров (0 -- корень из числа
+    # строк) и сколько ближайших кластеров просматривать для строки
+    approximate_lists: int = 0
+    approximate_probes: int = 16
+    # Сколько строк сравнивать с точным поиском при оценке recall@K
+    # приближенного поиска после обновления (0 -- не оценивать)
+    similarity_recall_sample: int = 200
+    # Количество пользователей в блоке при расчете сходства; определяет
+    # пиковый объем памяти (block_size x число пользователей)
+    similarity_block_size: int = 1024
+    # Как часто (в секундах) сверять версию снимка матриц в памяти
+    # с версией в хранилище
+    snapshot_check_interval: float = 10.0
+    # Каталог бинарных снимков модели, общий для всех воркеров
+    snapshot_dir: str = Field(default=os.path.join(BASE_DIR, "snapshots"))
+    # Сколько последних версий снимков хранить на диске
+    snapshot_keep_versions: int = 2
+    # Рассчитывать рекомендации для всех пользователей при обновлении
+    # матриц и отдавать их из коллекции user_recommendations
+    precompute_recommendations: bool = False
+    # Обновлять матрицы только по лайкам, изменившимся с прошлого
+    # обновления; полная пересборка -- не реже раза в full_refresh_interval
+    # секунд
+    incremental_refresh: bool = False
+    full_refresh_interval: int = 86400
+    # Перекрытие окна инкрементального обновления, секунды: лайки
+    # запрашиваются с момента начала прошлого чтения минус этот запас
+    ugc_high_water_mark_overlap: int = 300
+    # Запись коллекций матриц: документов в одном insert_many и сколько
+    # таких запросов выполнять одновременно
+    bulk_write_chunk_size: int = 1000
+    bulk_write_concurrency: int = 4
+    # Процессов для расчета матриц при обновлении (0 -- считать в потоке
+    # текущего процесса)
+    refresh_workers: int = 1
+    # Через сколько секунд без смены этапа задача обновления матриц
+    # считается зависшей и может быть запущена новая
+    refresh_job_timeout: int = 3600
+    # Пакетный расчет рекомендаций: пользователей в одном запросе и
+    # в одном блоке расчета (определяет объем памяти на блок)
+    batch_max_users: int = 50000
+    batch_block_size: int = 256
     min_best_movies_in_recommendations: int = 3
     min_new_movies_in_recommendations: int = 2
 
+    # Общий HTTP-клиент для запросов к UGC и Movies: соединений всего и
+    # на один хост, время жизни простаивающего соединения, таймауты
+    # (секунды) и число попыток запроса
+    http_connection_limit: int = 100
+    http_connection_limit_per_host: int = 20
+    http_keepalive_timeout: float = 30.0
+    http_connect_timeout: float = 2.0
+    http_timeout: float = 10.0
+    http_max_tries: int = 3
+
+    # Кэш данных фильмов из Movies: размер, время жизни записи и время
+    # жизни записи об отсутствующем фильме (секунды)
+    film_cache_size: int = 10000
+    film_cache_ttl: float = 300.0
+    film_cache_negative_ttl: float = 60.0
+
+    # Доля запросов, для которых замеряются задержки этапов обслуживания
+    serving_metrics_sample_rate: float = 0.1
+
     ugc_movies_endpoint: str = Field(default="localhost:80/api/v1/movies")
 
     movies_endpoint: str = Field(default="localhost:70/api/v1/films")
@@ -38,6 +127,10 @@ class Settings(BaseSettings):
     def mongo_dsn(self) -> str:
         return f"{self.mongo_recommendations_host}:{self.mongo_recommendations_port}"
 
+    @property
+    def ugc_likes_endpoint(self) -> str:
+        return f"{self.ugc_movies_endpoint}/likes"
+
 
 settings = Settings()
 
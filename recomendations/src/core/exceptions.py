@@ -9,3 +9,15 @@ class UserNotFoundtExeption(HTTPException):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found.",
         )
+
+
+class RefreshJobNotFoundException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Refresh job not found.",
+        )
+
+
+class MatricesRefreshError(Exception):
+    """Не удалось получить данные для обновления матриц."""
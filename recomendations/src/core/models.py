@@ -1,3 +1,5 @@
+from datetime import datetime
+from typing import Any
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -9,3 +11,41 @@ class FilmShort(BaseModel):
     uuid: UUID
     title: str | None = ""
     imdb_rating: float | None = 0
+
+
+class RefreshJob(BaseModel):
+    """Задача обновления матриц."""
+
+    job_id: str
+    # queued, running, succeeded, failed
+    status: str
+    # текущий этап обновления
+    phase: str | None = None
+    # длительность завершенных этапов, секунды
+    stages: dict[str, float] = {}
+    # показатели завершенных этапов: длительность, пиковый RSS (байты),
+    # количества строк и размеры матриц
+    metrics: dict[str, dict[str, Any]] = {}
+    created_at: datetime
+    finished_at: datetime | None = None
+    # версия модели, построенная задачей
+    version: str | None = None
+    error: str | None = None
+    # версия модели последнего успешного обновления
+    last_success_version: str | None = None
+
+
+class Metrics(BaseModel):
+    """Метрики сервиса рекомендаций."""
+
+    # последняя завершенная задача обновления матриц
+    refresh: RefreshJob | None = None
+    # гистограммы задержек этапов обслуживания запросов этого воркера
+    serving: dict[str, dict[str, Any]] = {}
+    # попадания и промахи кэша фильмов этого воркера с запуска и
+    # количество фильмов в кэше
+    film_cache: dict[str, int] = {}
+    # пиковый RSS воркера и процессов его пула обновления матриц, байты,
+    # с начала последнего этапа обновления (если их не было -- с запуска)
+    peak_rss: int
+    worker_peak_rss: int
@@ -0,0 +1,30 @@
+import asyncio
+
+import backoff
+from aiohttp import ClientError, ClientResponseError, ClientSession
+
+from core.config import settings
+
+http_session: ClientSession | None = None
+
+
+def get_http_session() -> ClientSession:
+    if http_session is None:
+        raise RuntimeError("HTTP client session has not been defined.")
+    return http_session
+
+
+def _is_client_error(exc: Exception) -> bool:
+    """Ответ 4xx: повтор запроса не поможет."""
+    return isinstance(exc, ClientResponseError) and exc.status < 500
+
+
+# Повтор запросов к UGC и Movies при сетевых ошибках и ответах 5xx
+# с экспоненциальной задержкой и full jitter
+http_retry = backoff.on_exception(
+    backoff.expo,
+    (ClientError, asyncio.TimeoutError),
+    max_tries=settings.http_max_tries,
+    jitter=backoff.full_jitter,
+    giveup=_is_client_error,
+)
@@ -1,11 +1,15 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from fastapi import FastAPI
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from api import recommendations
+from api import metrics, recommendations
 from core.config import settings
-from db import mongo
+from db import http, mongo
+from services import training
 
 
 @asynccontextmanager
@@ -13,9 +17,28 @@ async def lifespan(app: FastAPI):
     """Определение логики работы (запуска и остановки) приложения."""
     # Логика при запуске приложения.
     mongo.mongodb = AsyncIOMotorClient(settings.mongo_dsn)
+    http.http_session = ClientSession(
+        connector=TCPConnector(
+            limit=settings.http_connection_limit,
+            limit_per_host=settings.http_connection_limit_per_host,
+            keepalive_timeout=settings.http_keepalive_timeout,
+        ),
+        timeout=ClientTimeout(
+            total=settings.http_timeout,
+            connect=settings.http_connect_timeout,
+        ),
+    )
+    if settings.refresh_workers > 0:
+        training.executor = ProcessPoolExecutor(
+            max_workers=settings.refresh_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
     yield
     # Логика при завершении приложения.
     mongo.mongodb.close()
+    await http.http_session.close()
+    if training.executor is not None:
+        training.executor.shutdown(cancel_futures=True)
 
 
 app = FastAPI(
@@ -32,3 +55,8 @@ app.include_router(
     prefix="/api/v1/recommendations",
     tags=["Рекомендации"],
 )
+app.include_router(
+    metrics.router,
+    prefix="/api/v1/metrics",
+    tags=["Метрики"],
+)
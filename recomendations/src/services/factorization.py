@@ -0,0 +1,142 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Шагов метода сопряженных градиентов на одну половину итерации ALS
+ALS_CG_STEPS = 3
+# Не больше стольких оценок в блоке строк: блок держит в памяти
+# ``оценок x factors`` значений
+ALS_BLOCK_NNZ = 1 << 16
+
+
+def train_als(
+    ratings: csr_matrix,
+    factors: int,
+    iterations: int,
+    regularization: float,
+    alpha: float,
+    block_size: int,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Неявная матричная факторизация методом ALS.
+
+    Каждая оценка -- наблюдение с предпочтением 1 и уверенностью
+    ``1 + alpha * rating``, все остальные ячейки -- предпочтение 0 с
+    уверенностью 1. Факторы пользователей и фильмов по очереди
+    уточняются несколькими шагами метода сопряженных градиентов,
+    поэтому итерация стоит ``O(nnz * factors + (n_users + n_movies) *
+    factors^2)`` и не требует плотной матрицы оценок.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param factors: int - размерность латентных факторов
+    :param iterations: int - количество итераций ALS
+    :param regularization: float - коэффициент L2-регуляризации
+    :param alpha: float - рост уверенности с рейтингом
+    :param block_size: int - строк в блоке при пересчете факторов
+    :param seed: int - начальное значение генератора случайных чисел
+    :return: факторы пользователей (``n_users x factors``) и фильмов
+        (``n_movies x factors``), float32
+    """
+    n_users, n_movies = ratings.shape
+    rng = np.random.default_rng(seed)
+    user_factors = (
+        rng.standard_normal((n_users, factors), dtype=np.float32) * 0.01
+    )
+    movie_factors = (
+        rng.standard_normal((n_movies, factors), dtype=np.float32) * 0.01
+    )
+    # уверенность минус 1: вклад наблюдаемых ячеек сверх общего YtY
+    confidence = csr_matrix(ratings, dtype=np.float32, copy=True)
+    confidence.data = alpha * confidence.data
+    confidence_t = confidence.T.tocsr()
+    for _ in range(iterations):
+        _update_factors(
+            confidence,
+            user_factors,
+            movie_factors,
+            regularization,
+            block_size,
+        )
+        _update_factors(
+            confidence_t,
+            movie_factors,
+            user_factors,
+            regularization,
+            block_size,
+        )
+    return user_factors, movie_factors
+
+
+def _update_factors(
+    confidence: csr_matrix,
+    x: np.ndarray,
+    y: np.ndarray,
+    regularization: float,
+    block_size: int,
+) -> None:
+    """Пересчет факторов строк ``x`` при фиксированных ``y`` (на месте).
+
+    Для каждой строки приближенно решается
+    ``(YtY + Yt (C - I) Y + reg * I) x = Yt C p``.
+    """
+    factors = x.shape[1]
+    yty = y.T @ y + regularization * np.eye(factors, dtype=np.float32)
+    for start, stop in _row_blocks(confidence.indptr, block_size):
+        block = confidence[start:stop]
+        block_x = x[start:stop]
+        rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        # правая часть: сумма (1 + alpha * r) * y по оцененным столбцам
+        shifted = csr_matrix(
+            (block.data + 1, block.indices, block.indptr), shape=block.shape
+        )
+        rhs = shifted @ y
+        residual = rhs - _apply(block, rows, block_x, y, yty)
+        direction = residual.copy()
+        residual_norm = np.einsum("ij,ij->i", residual, residual)
+        for _ in range(ALS_CG_STEPS):
+            product = _apply(block, rows, direction, y, yty)
+            denominator = np.einsum("ij,ij->i", direction, product)
+            step = np.divide(
+                residual_norm,
+                denominator,
+                out=np.zeros_like(residual_norm),
+                where=denominator > 0,
+            )
+            block_x += step[:, None] * direction
+            residual -= step[:, None] * product
+            new_norm = np.einsum("ij,ij->i", residual, residual)
+            ratio = np.divide(
+                new_norm,
+                residual_norm,
+                out=np.zeros_like(new_norm),
+                where=residual_norm > 0,
+            )
+            direction = residual + ratio[:, None] * direction
+            residual_norm = new_norm
+
+
+def _apply(
+    block: csr_matrix,
+    rows: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    yty: np.ndarray,
+) -> np.ndarray:
+    """Произведение ``(YtY + Yt (C - I) Y) x`` для каждой строки блока."""
+    weights = block.data * np.einsum("ij,ij->i", x[rows], y[block.indices])
+    scaled = csr_matrix(
+        (weights, block.indices, block.indptr), shape=block.shape
+    )
+    return x @ yty + scaled @ y
+
+
+def _row_blocks(indptr: np.ndarray, block_size: int):
+    """Границы блоков не больше ``block_size`` строк и ``ALS_BLOCK_NNZ``
+    оценок (строка с большим числом оценок -- отдельный блок)."""
+    n_rows = len(indptr) - 1
+    start = 0
+    while start < n_rows:
+        end = indptr[start] + ALS_BLOCK_NNZ
+        limit = np.searchsorted(indptr, end, side="right") - 1
+        stop = max(min(start + block_size, limit, n_rows), start + 1)
+        yield start, stop
+        start = stop
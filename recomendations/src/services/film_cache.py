@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+
+from core.config import settings
+
+# Момент истечения и данные фильма (None -- фильма нет в Movies)
+CacheItem = tuple[float, dict | None]
+
+
+class FilmCache:
+    """LRU-кэш данных фильмов из Movies с ограниченным временем жизни.
+
+    Кэшируется и отсутствие фильма в Movies (значение None), но на
+    меньшее время, чтобы новые фильмы появлялись в ответах быстрее.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # uuid -> CacheItem в порядке последнего обращения
+        self._items: OrderedDict[str, CacheItem] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(
+        self, movies_uuid: list[str]
+    ) -> tuple[dict[str, dict | None], list[str]]:
+        """Поиск фильмов в кэше.
+
+        :param movies_uuid: list[str] - UUID фильмов
+        :return: найденные в кэше фильмы (None -- фильма нет в Movies) и
+            UUID, которых в кэше нет, без повторов
+        """
+        now = time.monotonic()
+        cached = {}
+        missing = []
+        for movie_uuid in dict.fromkeys(movies_uuid):
+            item = self._items.get(movie_uuid)
+            if item is None or item[0] <= now:
+                self._items.pop(movie_uuid, None)
+                missing.append(movie_uuid)
+                continue
+            self._items.move_to_end(movie_uuid)
+            cached[movie_uuid] = item[1]
+        self.hits += len(cached)
+        self.misses += len(missing)
+        return cached, missing
+
+    def put(self, movie_uuid: str, movie_data: dict | None) -> None:
+        """Сохранение фильма (None -- фильма нет в Movies)."""
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl if movie_data is not None else self.negative_ttl
+        self._items[movie_uuid] = (time.monotonic() + ttl, movie_data)
+        self._items.move_to_end(movie_uuid)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def to_dict(self) -> dict[str, int]:
+        """Счетчики попаданий и промахов и размер кэша для метрик."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._items),
+        }
+
+
+film_cache = FilmCache(
+    max_size=settings.film_cache_size,
+    ttl=settings.film_cache_ttl,
+    negative_ttl=settings.film_cache_negative_ttl,
+)
@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+from itertools import chain
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+
+@dataclass(frozen=True)
+class RatingMatrix:
+    """Разреженная матрица "пользователь-фильм".
+
+    Строки матрицы соответствуют ``user_ids``, столбцы -- ``movie_ids``;
+    оба массива отсортированы, индекс в массиве -- номер строки/столбца.
+    """
+
+    user_ids: np.ndarray
+    movie_ids: np.ndarray
+    ratings: csr_matrix
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.ratings.shape
+
+    @property
+    def nnz(self) -> int:
+        return self.ratings.nnz
+
+    def user_row(self, user_id: str) -> int:
+        """Номер строки пользователя (бинарный поиск по ``user_ids``).
+
+        :raises KeyError: пользователя нет в матрице
+        """
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            raise KeyError(user_id)
+        return row
+
+
+def build_rating_matrix(users, movies, ratings) -> RatingMatrix:
+    """Построение CSR-матрицы из троек (пользователь, фильм, рейтинг).
+
+    Повторные оценки одного фильма одним пользователем усредняются,
+    как это делал ``pivot_table`` с агрегатором по умолчанию.
+    """
+    user_ids, rows = np.unique(
+        np.asarray(users, dtype=object), return_inverse=True
+    )
+    movie_ids, cols = np.unique(
+        np.asarray(movies, dtype=object), return_inverse=True
+    )
+    return _build_from_codes(
+        user_ids.astype(str), rows, movie_ids.astype(str), cols, ratings
+    )
+
+
+def build_rating_matrix_from_rows(
+    user_ids: list[str],
+    row_movies: list[list[str]],
+    row_ratings: list[list[float]],
+) -> RatingMatrix:
+    """Построение CSR-матрицы по строкам пользователей.
+
+    Строка пользователя ``user_ids[i]`` -- параллельные списки фильмов
+    ``row_movies[i]`` и их оценок ``row_ratings[i]``; номера строк
+    получаются по ``user_ids`` без повторения id на каждую оценку.
+    """
+    lengths = np.fromiter(
+        map(len, row_movies), dtype=np.int64, count=len(row_movies)
+    )
+    user_ids, user_codes = np.unique(
+        np.asarray(user_ids, dtype=object), return_inverse=True
+    )
+    movie_ids, cols = np.unique(
+        np.fromiter(
+            chain.from_iterable(row_movies), dtype=object, count=lengths.sum()
+        ),
+        return_inverse=True,
+    )
+    ratings = np.fromiter(
+        chain.from_iterable(row_ratings), dtype=np.float64, count=len(cols)
+    )
+    return _build_from_codes(
+        user_ids.astype(str),
+        np.repeat(user_codes, lengths),
+        movie_ids.astype(str),
+        cols,
+        ratings,
+    )
+
+
+def _build_from_codes(
+    user_ids: np.ndarray,
+    rows: np.ndarray,
+    movie_ids: np.ndarray,
+    cols: np.ndarray,
+    ratings,
+) -> RatingMatrix:
+    """Построение CSR-матрицы по номерам строк и столбцов оценок.
+
+    ``user_ids`` и ``movie_ids`` должны быть отсортированы.
+    """
+    shape = (len(user_ids), len(movie_ids))
+    values = np.asarray(ratings, dtype=np.float64)
+
+    # Сумма оценок и их количество по каждой ячейке; coo -> csr
+    # складывает дубликаты.
+    sums = coo_matrix((values, (rows, cols)), shape=shape).tocsr()
+    counts = coo_matrix(
+        (np.ones_like(values), (rows, cols)), shape=shape
+    ).tocsr()
+    sums.data /= counts.data
+    sums.eliminate_zeros()
+
+    return RatingMatrix(user_ids=user_ids, movie_ids=movie_ids, ratings=sums)
+
+
+def _sorted_codes(ids: dict[str, int]) -> tuple[np.ndarray, np.ndarray]:
+    """Отсортированные id и новый номер для каждого кода в порядке выдачи."""
+    unsorted_ids = np.array(list(ids), dtype=str)
+    order = np.argsort(unsorted_ids, kind="stable")
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    return unsorted_ids[order], ranks
+
+
+class RatingTriples:
+    """Накопитель оценок (пользователь, фильм, рейтинг).
+
+    Оценки сразу складываются в числовые массивы (номера пользователя и
+    фильма и рейтинг), которые растут удвоением, без промежуточных
+    списков Python.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._user_codes: dict[str, int] = {}
+        self._movie_codes: dict[str, int] = {}
+        self._rows = np.empty(capacity, dtype=np.int32)
+        self._cols = np.empty(capacity, dtype=np.int32)
+        self._ratings = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def append(self, user_id: str, movie_id: str, rating: float) -> None:
+        if self.size == len(self._rows):
+            self._grow()
+        self._rows[self.size] = self._user_codes.setdefault(
+            user_id, len(self._user_codes)
+        )
+        self._cols[self.size] = self._movie_codes.setdefault(
+            movie_id, len(self._movie_codes)
+        )
+        self._ratings[self.size] = rating
+        self.size += 1
+
+    def _grow(self) -> None:
+        capacity = max(2 * len(self._rows), 1)
+        for name in ("_rows", "_cols", "_ratings"):
+            array = getattr(self, name)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            setattr(self, name, grown)
+
+    def to_matrix(self) -> RatingMatrix:
+        user_ids, user_ranks = _sorted_codes(self._user_codes)
+        movie_ids, movie_ranks = _sorted_codes(self._movie_codes)
+        return _build_from_codes(
+            user_ids,
+            user_ranks[self._rows[: self.size]],
+            movie_ids,
+            movie_ranks[self._cols[: self.size]],
+            self._ratings[: self.size],
+        )
+
+
+def find_positions(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Позиции ``ids`` в отсортированном ``sorted_ids`` (-1 -- id нет)."""
+    if not len(sorted_ids):
+        return np.full(len(ids), -1)
+    positions = np.minimum(
+        np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1
+    )
+    return np.where(sorted_ids[positions] == ids, positions, -1)
+
+
+def _find_rows(matrix: RatingMatrix, user_ids: np.ndarray) -> np.ndarray:
+    """Номера строк пользователей в матрице (-1 -- пользователя нет)."""
+    return find_positions(matrix.user_ids, user_ids)
+
+
+def _entries(matrix: RatingMatrix, mask: np.ndarray) -> set[tuple]:
+    """Оценки матрицы, выбранные маской по ее ненулевым элементам."""
+    entries = matrix.ratings.tocoo()
+    return set(
+        zip(
+            matrix.user_ids[entries.row[mask]].tolist(),
+            matrix.movie_ids[entries.col[mask]].tolist(),
+            entries.data[mask].tolist(),
+        )
+    )
+
+
+def merge_movie_ratings(
+    previous: RatingMatrix, changed_movies, delta: RatingMatrix
+) -> tuple[RatingMatrix, np.ndarray, np.ndarray]:
+    """Замена оценок измененных фильмов в матрице новыми.
+
+    Все оценки фильмов из ``changed_movies`` берутся из ``delta``,
+    остальные -- из ``previous``.
+
+    :return: новая матрица; маска ее строк, вектор которых изменился
+        (включая новых пользователей); номер строки в новой матрице для
+        каждого пользователя ``previous`` (-1 -- у пользователя больше нет
+        оценок)
+    """
+    changed_movies = np.asarray(list(changed_movies), dtype=str)
+    entries = previous.ratings.tocoo()
+    previous_changed = np.isin(previous.movie_ids[entries.col], changed_movies)
+    keep = ~previous_changed
+    delta_entries = delta.ratings.tocoo()
+    current = build_rating_matrix(
+        np.concatenate(
+            [
+                previous.user_ids[entries.row[keep]],
+                delta.user_ids[delta_entries.row],
+            ]
+        ),
+        np.concatenate(
+            [
+                previous.movie_ids[entries.col[keep]],
+                delta.movie_ids[delta_entries.col],
+            ]
+        ),
+        np.concatenate([entries.data[keep], delta_entries.data]),
+    )
+    previous_to_current = _find_rows(current, previous.user_ids)
+
+    # вектор пользователя мог измениться только в столбцах измененных
+    # фильмов: сравниваем эти оценки до и после
+    current_changed = np.isin(
+        current.movie_ids[current.ratings.tocoo().col], changed_movies
+    )
+    difference = _entries(previous, previous_changed) ^ _entries(
+        current, current_changed
+    )
+    changed_users = np.asarray(
+        sorted({user_id for user_id, _, _ in difference}), dtype=str
+    )
+    changed = np.zeros(len(current.user_ids), dtype=bool)
+    rows = _find_rows(current, changed_users)
+    changed[rows[rows >= 0]] = True
+    # новые пользователи
+    changed[
+        np.setdiff1d(
+            np.arange(len(current.user_ids)),
+            previous_to_current[previous_to_current >= 0],
+        )
+    ] = True
+    return current, changed, previous_to_current
@@ -0,0 +1,156 @@
+import random
+import resource
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator
+
+from core.config import settings
+
+# Верхние границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# Наибольший пиковый RSS процессов пула обновления матриц с последнего
+# сброса, байты
+worker_peak_rss = 0
+
+
+def peak_rss() -> int:
+    """Пиковый RSS текущего процесса с последнего reset_peak_rss, байты.
+
+    Берется VmHWM из /proc/self/status; там, где его нет, -- пиковый RSS
+    за все время работы процесса (ru_maxrss).
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    # значение в килобайтах
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss в Linux -- в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_rss() -> None:
+    """Сброс пикового RSS текущего процесса до текущего RSS (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def record_worker_peak_rss(value: int) -> None:
+    """Учет пикового RSS процесса пула, выполнившего CPU-операцию."""
+    global worker_peak_rss
+    worker_peak_rss = max(worker_peak_rss, value)
+
+
+def reset_worker_peak_rss() -> None:
+    global worker_peak_rss
+    worker_peak_rss = 0
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами LATENCY_BUCKETS."""
+
+    def __init__(self) -> None:
+        # последняя корзина -- задержки больше последней границы
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def to_dict(self) -> dict:
+        """Количество, сумма и накопленные количества по корзинам
+        (``le`` -- верхняя граница, как в Prometheus)."""
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "buckets": buckets,
+        }
+
+
+class RequestTimer:
+    """Замер этапов одного запроса.
+
+    Задержки записываются только для запросов, попавших в выборку,
+    иначе замер ничего не делает.
+    """
+
+    def __init__(
+        self, metrics: "ServingMetrics", name: str, sampled: bool
+    ) -> None:
+        self._metrics = metrics
+        self._name = name
+        self.sampled = sampled
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Замер этапа ``stage`` (гистограмма ``<запрос>.<этап>``)."""
+        if not self.sampled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._metrics.observe(
+                f"{self._name}.{stage}", time.perf_counter() - started
+            )
+
+
+class ServingMetrics:
+    """Гистограммы задержек этапов обслуживания запросов процесса.
+
+    Замеряется доля serving_metrics_sample_rate запросов. Гистограммы
+    у каждого воркера свои.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, LatencyHistogram] = {}
+
+    def request(self, name: str) -> RequestTimer:
+        """Замер этапов нового запроса ``name``."""
+        return RequestTimer(
+            self, name, random.random() < settings.serving_metrics_sample_rate
+        )
+
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def to_dict(self) -> dict[str, dict]:
+        return {
+            name: histogram.to_dict()
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+
+serving_metrics = ServingMetrics()
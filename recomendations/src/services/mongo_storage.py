@@ -1,10 +1,18 @@
+import asyncio
+import logging
+import re
 from abc import ABC, abstractmethod
 from typing import Any
 
 from fastapi import Depends
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
+from core.config import settings
 from db.mongo import get_mongodb
 
+logger = logging.getLogger(__name__)
+
 
 class AbstractStorage(ABC):
     def __init__(self, collection):
@@ -21,6 +29,21 @@ class AbstractStorage(ABC):
         """
         pass
 
+    @abstractmethod
+    async def get_by_id(
+        self,
+        filters: dict,
+        projection: dict | None = None,
+    ) -> dict | None:
+        """
+        Возвращает документ из коллекции по заданному фильтру.
+
+        :param filters: dict - фильтр для поиска
+        :param projection: dict | None - возвращаемые поля документа
+        :return: dict | None - найденный документ или None, если не найден
+        """
+        pass
+
     @abstractmethod
     async def insert_many(
         self,
@@ -29,11 +52,54 @@ class AbstractStorage(ABC):
         """
         Добавляет список документов в коллекцию.
 
+        Документы пишутся кусками по bulk_write_chunk_size неупорядоченными
+        запросами, не более bulk_write_concurrency одновременно.
+
         :param data: list[dict] - список документов для добавления
         :return: None
         """
         pass
 
+    @abstractmethod
+    async def upsert_one(self, filters: dict, data: dict) -> None:
+        """
+        Обновляет документ в коллекции по фильтру или вставляет новый,
+        если документ не найден.
+
+        :param filters: dict - фильтр для поиска
+        :param data: dict - операции обновления
+        :return: None
+        """
+        pass
+
+    @abstractmethod
+    async def update_one(self, filters: dict, data: dict) -> None:
+        """
+        Обновляет документ в коллекции по фильтру.
+
+        :param filters: dict - фильтр для поиска
+        :param data: dict - операции обновления
+        :return: None
+        """
+        pass
+
+    @abstractmethod
+    async def find_one_and_upsert(
+        self, filters: dict, data: dict
+    ) -> dict | None:
+        """
+        Атомарно обновляет документ по фильтру или вставляет новый.
+
+        Если документ с тем же _id уже есть, но не подходит под фильтр,
+        ничего не меняется.
+
+        :param filters: dict - фильтр для поиска (с _id документа)
+        :param data: dict - операции обновления
+        :return: dict | None - документ после обновления или None, если
+            документ не подходит под фильтр
+        """
+        pass
+
     @abstractmethod
     async def delete_all(self) -> None:
         """
@@ -43,6 +109,35 @@ class AbstractStorage(ABC):
         """
         pass
 
+    @abstractmethod
+    def versioned(self, version: str | None) -> "AbstractStorage":
+        """
+        Возвращает хранилище для коллекции версии модели
+        ``<коллекция>_<version>``.
+
+        :param version: str | None - версия модели; None -- сама коллекция
+        :return: AbstractStorage
+        """
+        pass
+
+    @abstractmethod
+    async def list_versions(self) -> list[str]:
+        """
+        Возвращает версии, для которых существуют коллекции.
+
+        :return: list[str]
+        """
+        pass
+
+    @abstractmethod
+    async def drop(self) -> None:
+        """
+        Удаляет коллекцию.
+
+        :return: None
+        """
+        pass
+
     @abstractmethod
     async def distinct(
         self,
@@ -63,12 +158,78 @@ class MongoStorage(AbstractStorage):
         docs = await cursor.to_list(length=None)
         return docs
 
+    async def get_by_id(
+        self, filters: dict, projection: dict | None = None
+    ) -> dict | None:
+        doc = await self.collection.find_one(filters, projection)
+        return doc if doc else None
+
     async def insert_many(self, data: list[dict]) -> None:
-        await self.collection.insert_many(data)
+        if not data:
+            return
+        chunk_size = max(settings.bulk_write_chunk_size, 1)
+        chunks = [
+            data[start : start + chunk_size]
+            for start in range(0, len(data), chunk_size)
+        ]
+        semaphore = asyncio.Semaphore(max(settings.bulk_write_concurrency, 1))
+        written = 0
+
+        async def write(chunk: list[dict]) -> None:
+            nonlocal written
+            async with semaphore:
+                await self.collection.insert_many(chunk, ordered=False)
+            written += len(chunk)
+            logger.debug(
+                f"{self.collection.name}: записано {written} из {len(data)}"
+            )
+
+        await asyncio.gather(*(write(chunk) for chunk in chunks))
+        logger.info(
+            f"{self.collection.name}: записано {len(data)} документов "
+            f"({len(chunks)} запросов)"
+        )
+
+    async def upsert_one(self, filters: dict, data: dict) -> None:
+        await self.collection.update_one(filters, data, upsert=True)
+
+    async def update_one(self, filters: dict, data: dict) -> None:
+        await self.collection.update_one(filters, data)
+
+    async def find_one_and_upsert(
+        self, filters: dict, data: dict
+    ) -> dict | None:
+        try:
+            return await self.collection.find_one_and_update(
+                filters,
+                data,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return None
 
     async def delete_all(self) -> None:
         await self.collection.delete_many({})
 
+    def versioned(self, version: str | None) -> "MongoStorage":
+        if version is None:
+            return self
+        database = self.collection.database
+        return MongoStorage(
+            collection=database[f"{self.collection.name}_{version}"]
+        )
+
+    async def list_versions(self) -> list[str]:
+        prefix = f"{self.collection.name}_"
+        names = await self.collection.database.list_collection_names(
+            filter={"name": {"$regex": f"^{re.escape(prefix)}"}}
+        )
+        return [name[len(prefix) :] for name in names]
+
+    async def drop(self) -> None:
+        await self.collection.drop()
+
     async def distinct(self, field: str) -> list[Any]:
         distinct_values = await self.collection.distinct(field)
         return distinct_values
@@ -88,8 +249,43 @@ def get_similarity_storage(
     return MongoStorage(collection=collection)
 
 
+def get_movie_similarity_storage(
+    collection=Depends(get_mongodb),
+) -> MongoStorage:
+    collection = collection["movie_recommender"]["movie_similarity"]
+    return MongoStorage(collection=collection)
+
+
+def get_model_factors_storage(
+    collection=Depends(get_mongodb),
+) -> MongoStorage:
+    collection = collection["movie_recommender"]["model_factors"]
+    return MongoStorage(collection=collection)
+
+
 def get_new_movies_storage(
     collection=Depends(get_mongodb),
 ) -> MongoStorage:
     collection = collection["movie_recommender"]["new_movies"]
     return MongoStorage(collection=collection)
+
+
+def get_model_version_storage(
+    collection=Depends(get_mongodb),
+) -> MongoStorage:
+    collection = collection["movie_recommender"]["model_version"]
+    return MongoStorage(collection=collection)
+
+
+def get_user_recommendations_storage(
+    collection=Depends(get_mongodb),
+) -> MongoStorage:
+    collection = collection["movie_recommender"]["user_recommendations"]
+    return MongoStorage(collection=collection)
+
+
+def get_refresh_jobs_storage(
+    collection=Depends(get_mongodb),
+) -> MongoStorage:
+    collection = collection["movie_recommender"]["refresh_jobs"]
+    return MongoStorage(collection=collection)
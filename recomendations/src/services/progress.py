@@ -0,0 +1,77 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from services import metrics
+
+# Обработчик перехода обновления к следующему этапу
+ProgressCallback = Callable[["RefreshProgress"], Awaitable[None]]
+
+
+class RefreshProgress:
+    """Этапы обновления матриц и их длительность.
+
+    Этап длится от вызова ``stage`` до начала следующего этапа или вызова
+    ``finish``. После каждого перехода вызывается ``on_change`` (например,
+    чтобы сохранить состояние задачи обновления).
+
+    В ``metrics`` для каждого завершенного этапа -- длительность, пиковый
+    RSS процесса и процессов пула за время этапа и показатели, записанные
+    через ``record`` (количества строк, размеры матриц); в ``total`` --
+    длительность и пиковый RSS всего обновления.
+    """
+
+    def __init__(
+        self,
+        on_change: ProgressCallback | None = None,
+    ) -> None:
+        self.phase: str | None = None
+        # длительность завершенных этапов, секунды
+        self.stages: dict[str, float] = {}
+        self.metrics: dict[str, dict[str, Any]] = {}
+        self._on_change = on_change
+        self._started_at = 0.0
+
+    async def stage(self, name: str) -> None:
+        """Начало этапа ``name``."""
+        self._close_stage()
+        self.phase = name
+        self._started_at = time.monotonic()
+        # пиковый RSS считается заново для каждого этапа
+        metrics.reset_peak_rss()
+        metrics.reset_worker_peak_rss()
+        await self._notify()
+
+    async def finish(self) -> None:
+        """Завершение последнего этапа."""
+        self._close_stage()
+        self.phase = None
+        stages = list(self.metrics.values())
+        if stages:
+            self.metrics["total"] = {
+                "seconds": round(sum(self.stages.values()), 3),
+                "peak_rss": max(stage["peak_rss"] for stage in stages),
+                "worker_peak_rss": max(
+                    stage["worker_peak_rss"] for stage in stages
+                ),
+            }
+        await self._notify()
+
+    def record(self, **values: Any) -> None:
+        """Показатели текущего этапа."""
+        if self.phase is not None:
+            self.metrics.setdefault(self.phase, {}).update(values)
+
+    def _close_stage(self) -> None:
+        if self.phase is not None:
+            self.stages[self.phase] = round(
+                time.monotonic() - self._started_at, 3
+            )
+            self.record(
+                seconds=self.stages[self.phase],
+                peak_rss=metrics.peak_rss(),
+                worker_peak_rss=metrics.worker_peak_rss,
+            )
+
+    async def _notify(self) -> None:
+        if self._on_change is not None:
+            await self._on_change(self)
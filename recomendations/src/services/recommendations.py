@@ -1,225 +1,584 @@
+import asyncio
+import heapq
+import json
 import logging
-from collections import defaultdict
+import time
+from datetime import datetime, timezone
+from itertools import chain
+from typing import AsyncIterator
 
-import pandas as pd
-from aiohttp import ClientSession
+import numpy as np
+from aiohttp import ClientSession, ClientTimeout
 from fastapi import Depends
-from sklearn.metrics.pairwise import cosine_similarity
 
 from core.config import settings
-from core.exceptions import UserNotFoundtExeption
+from core.exceptions import MatricesRefreshError, UserNotFoundtExeption
 from core.models import FilmShort
+from db.http import get_http_session, http_retry
 from services.mongo_storage import (
     MongoStorage,
     get_user_movie_storage,
     get_similarity_storage,
+    get_movie_similarity_storage,
+    get_model_factors_storage,
     get_new_movies_storage,
+    get_model_version_storage,
+    get_user_recommendations_storage,
 )
+from services.film_cache import film_cache
+from services.matrix import RatingMatrix, build_rating_matrix_from_rows
+from services.metrics import serving_metrics
+from services.progress import RefreshProgress
+from services.scoring import (
+    get_movies_uuid,
+    get_uuid_list,
+    score_snapshot_users,
+)
+from services.snapshot import (
+    ALS,
+    ITEM_ITEM,
+    USER_USER,
+    MatrixSnapshot,
+    load_snapshot,
+    save_snapshot,
+    snapshot_holder,
+)
+from services.training import (
+    build_model,
+    build_records,
+    build_recommendations_records,
+    is_approximate_model,
+    model_recall,
+    run_cpu_bound,
+    update_model,
+)
+from services.ugc_likes import UgcLikesParser
 
 logger = logging.getLogger(__name__)
 
+# _id документа с активной версией модели в коллекции model_version
+MODEL_VERSION_ID = "active"
+# Размер куска при чтении потока лайков из UGC
+UGC_CHUNK_SIZE = 64 * 1024
+# Фоновые задачи (удаление старых версий), ссылки на которые нужно
+# держать до их завершения
+background_tasks: set[asyncio.Task] = set()
+
 
 class RecommendationsService:
     def __init__(
         self,
         user_movie_collection: MongoStorage,
         similarity_collection: MongoStorage,
+        movie_similarity_collection: MongoStorage,
+        model_factors_collection: MongoStorage,
         new_movies_collection: MongoStorage,
+        version_collection: MongoStorage,
+        user_recommendations_collection: MongoStorage,
+        http_session: ClientSession,
     ) -> None:
         self.user_movie_collection = user_movie_collection
         self.similarity_collection = similarity_collection
+        self.movie_similarity_collection = movie_similarity_collection
+        self.model_factors_collection = model_factors_collection
         self.new_movies_collection = new_movies_collection
+        self.version_collection = version_collection
+        self.user_recommendations_collection = user_recommendations_collection
+        self.http_session = http_session
+
+    async def refresh_matrices(
+        self, progress: RefreshProgress | None = None
+    ) -> str | None:
+        """Создание/обновление существующих матриц.
 
-    async def refresh_matrices(self) -> None:
-        """Создание/обновление существующих матриц."""
-        raw_data = await self._fetch_movies_data(settings.ugc_movies_endpoint)
-        df_likes = self._process_data(raw_data)
+        При включенном incremental_refresh пересчитываются только оценки
+        фильмов, лайки которых изменились с прошлого обновления, и соседи
+        затронутых пользователей; полная пересборка выполняется не реже
+        раза в full_refresh_interval.
 
-        # Создание матрицы "пользователь-фильм"
-        user_movie_matrix = df_likes.pivot_table(
-            index="user_id", columns="movie_id", values="rating", fill_value=0
+        :param progress: RefreshProgress | None - учет этапов обновления
+        :return: str | None - опубликованная версия модели или None, если
+            обновлять нечего
+        :raises MatricesRefreshError: не удалось получить лайки из UGC
+        """
+        progress = progress or RefreshProgress()
+        await progress.stage("fetch_likes")
+        version_data = (
+            await self.version_collection.get_by_id({"_id": MODEL_VERSION_ID})
+            or {}
         )
-        # Преобразование в нужный формат и сохранение в коллекцию
-        user_movie_records = []
-        for user_id, row in user_movie_matrix.iterrows():
-            user_movie_data = {
-                "_id": user_id,  # Устанавливаем user_id как _id
-                "movies": [],  # Список фильмов и рейтингов
-            }
-            for movie_id, rating in row.items():
-                user_movie_data["movies"].append(
-                    {"movie_id": movie_id, "rating": rating}
+        full_refreshed_at = version_data.get("full_refreshed_at")
+        high_water_mark = version_data.get("ugc_high_water_mark")
+        engine = settings.recommendations_engine
+        top_k = self._get_similarity_top_k(engine)
+        model = None
+        if self._is_incremental_refresh(version_data):
+            snapshot = await self._load_current_snapshot()
+            if snapshot.version == version_data.get("version"):
+                likes = await self._fetch_likes(high_water_mark)
+                if likes is None:
+                    raise MatricesRefreshError(
+                        "Не удалось получить лайки из UGC"
+                    )
+                progress.record(
+                    movies=len(likes.movie_ids), ratings=likes.triples.size
                 )
-            user_movie_records.append(user_movie_data)
-        await self.user_movie_collection.delete_all()
-        await self.user_movie_collection.insert_many(user_movie_records)
-
-        # Вычисление косинусного сходства между пользователями
-        similarity_matrix = pd.DataFrame(
-            cosine_similarity(user_movie_matrix),
-            index=user_movie_matrix.index,
-            columns=user_movie_matrix.index,
-        )
-        # Преобразование в нужный формат и сохранение в коллекцию user_similarity
-        similarity_records = []
-        for user_id, row in similarity_matrix.iterrows():
-            similarity_data = {
-                "_id": user_id,  # Устанавливаем user_id как _id
-                "similar_users": [],  # Список схожих пользователей и их similarity
-            }
-            for other_user_id, similarity in row.items():
-                similarity_data["similar_users"].append(
-                    {"user_id": other_user_id, "similarity": similarity}
+                if not likes.movie_ids:
+                    logger.info("Нет изменений лайков с прошлого обновления.")
+                    await progress.finish()
+                    return None
+                await progress.stage("build_model")
+                model, changed_users = await run_cpu_bound(
+                    update_model,
+                    snapshot,
+                    likes.movie_ids,
+                    likes.triples,
+                    top_k,
+                    settings.similarity_block_size,
+                )
+                progress.record(incremental=True, changed_rows=changed_users)
+                logger.info(
+                    f"Инкрементальное обновление: фильмов "
+                    f"{len(likes.movie_ids)}, "
+                    f"пересчитано строк {changed_users}"
                 )
-            similarity_records.append(similarity_data)
-        await self.similarity_collection.delete_all()
-        await self.similarity_collection.insert_many(similarity_records)
-        # Получаем список новых фильмов и сохраняем в коллекцию
-        new_movies_list = await self._get_new_movies_list(user_movie_matrix)
+                high_water_mark = likes.high_water_mark
+        if model is None:
+            likes = await self._fetch_likes()
+            if likes is None:
+                raise MatricesRefreshError("Не удалось получить лайки из UGC")
+            progress.record(
+                movies=len(likes.movie_ids), ratings=likes.triples.size
+            )
+            await progress.stage("build_model")
+            # Матрица "пользователь-фильм" и top-K соседей каждого
+            # пользователя (фильма для item_item) или факторы als
+            # строятся в пуле процессов, не блокируя запросы
+            model = await run_cpu_bound(
+                build_model,
+                likes.triples,
+                top_k,
+                settings.similarity_block_size,
+                engine,
+            )
+            if model is None:
+                logger.warning("Нет оценок для построения матриц.")
+                await progress.finish()
+                return None
+            high_water_mark = likes.high_water_mark
+            full_refreshed_at = time.time()
+        rating_matrix, model_arrays = model
+        progress.record(
+            engine=engine,
+            shape=list(rating_matrix.shape),
+            nnz=rating_matrix.nnz,
+            arrays={
+                name: list(array.shape) for name, array in model_arrays.items()
+            },
+        )
+        # Качество приближенного поиска соседей: доля точных top-K соседей
+        # на выборке строк
+        similarity_recall = None
+        if settings.similarity_recall_sample and is_approximate_model(
+            model, engine
+        ):
+            await progress.stage("similarity_recall")
+            similarity_recall = await run_cpu_bound(
+                model_recall,
+                model,
+                engine,
+                settings.similarity_recall_sample,
+                settings.similarity_block_size,
+            )
+            progress.record(recall=similarity_recall)
+            logger.info(f"recall@K соседей: {similarity_recall:.3f}")
+        # Новая версия пишется в отдельные коллекции <коллекция>_<версия>,
+        # читатели переключаются на нее только после публикации версии
+        version = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        await progress.stage("build_records")
+        user_movie_records, similarity_records = await run_cpu_bound(
+            build_records, model, engine
+        )
+        progress.record(
+            user_movie_records=len(user_movie_records),
+            model_records=len(similarity_records),
+        )
+        # Получаем список новых фильмов
+        await progress.stage("fetch_new_movies")
+        new_movies_list = await self._get_new_movies_list(
+            rating_matrix.movie_ids.tolist()
+        )
         new_movies_records = []
         for uuid in new_movies_list:
             record = {"_id": uuid}
             new_movies_records.append(record)
-        await self.new_movies_collection.delete_all()
-        if new_movies_records:
-            await self.new_movies_collection.insert_many(new_movies_records)
-
-    async def get_recommendations(self, user_id: str) -> list[FilmShort]:
-        """Получение списка рекомендаций с учетом лучших фильмов."""
+        progress.record(new_movies=len(new_movies_records))
+        # Коллекции независимы, поэтому пишем их одновременно
+        await progress.stage("write_collections")
+        await asyncio.gather(
+            self.user_movie_collection.versioned(version).insert_many(
+                user_movie_records
+            ),
+            self._get_model_collection(engine)
+            .versioned(version)
+            .insert_many(similarity_records),
+            self.new_movies_collection.versioned(version).insert_many(
+                new_movies_records
+            ),
+        )
+        # Рейтинг популярности, новинки и рекомендации пользователям без
+        # оценок не меняются до следующего обновления, поэтому хранятся
+        # в снимке вместе с матрицами
+        snapshot = MatrixSnapshot(
+            version=version,
+            rating_matrix=rating_matrix,
+            engine=engine,
+            **model_arrays,
+            **self._get_movie_lists(rating_matrix, new_movies_list),
+        )
+        # Предрасчет списков рекомендаций для всех пользователей
+        if settings.precompute_recommendations:
+            await progress.stage("precompute_recommendations")
+            progress.record(users=rating_matrix.shape[0])
+            await self._store_precomputed_recommendations(snapshot)
+        # Бинарный снимок для быстрой загрузки остальными воркерами
+        await progress.stage("save_snapshot")
         try:
-            # получение матриц
-            user_movie_matrix, similarity_matrix = await self._fetch_matrices()
-            # Получаем список movies_uuid по популярности:
-            best_movies_list = self._get_average_ratings(user_movie_matrix)
-            # получаем список новых фильмов
-            new_movies_list = await self.new_movies_collection.distinct("_id")
-            # Находим схожих пользователей
-            similar_users = similarity_matrix[user_id].sort_values(
-                ascending=False
-            )[1 : (settings.num_similar_users + 1)]  # исключая самого себя
-            # Собираем рекомендации от схожих пользователей
-            recommended_movies = defaultdict(float)
-            for other_user, similarity in similar_users.items():
-                for movie, rating in user_movie_matrix.loc[other_user].items():
-                    if (
-                        rating > 0
-                        and user_movie_matrix.at[user_id, movie] == 0
-                    ):  # фильм понравился другому и не смотрел целевой
-                        recommended_movies[movie] += similarity * rating
-            # Сортировка рекомендаций
-            recommended_movies_sorted = sorted(
-                recommended_movies.items(), key=lambda x: x[1], reverse=True
+            await asyncio.to_thread(
+                save_snapshot, snapshot, settings.snapshot_dir
             )
-            # Возвращаем топ рекомендаций
-            recommended_movies_list = [
-                movie for movie, _ in recommended_movies_sorted
-            ]
-            movies_uuid = self._get_uuid_list(
-                recommended_movies_list, best_movies_list, new_movies_list
-            )
-            # получаем данные по фильмам из movies
-            movies_data = await self._fetch_movies_data_by_uuid(
-                movies_uuid[: settings.num_recommendations]
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении снимка матриц: {e}")
+        # Публикуем новую версию: остальные процессы перечитают снимок,
+        # текущий подменяет его сразу
+        await progress.stage("publish")
+        previous_version = version_data.get("version")
+        # под блокировкой снимка: начатая до публикации загрузка прежней
+        # версии завершится раньше и не подменит новый снимок
+        async with snapshot_holder.lock:
+            await self.version_collection.upsert_one(
+                {"_id": MODEL_VERSION_ID},
+                {
+                    "$set": {
+                        "version": version,
+                        "previous_version": previous_version,
+                        "ugc_high_water_mark": high_water_mark,
+                        "full_refreshed_at": full_refreshed_at,
+                        "engine": engine,
+                        "similarity_top_k": top_k,
+                        "similarity_recall": similarity_recall,
+                    }
+                },
             )
-            # сортируем результат
-            recommendations = self._sort_movies(movies_uuid, movies_data)
+            snapshot_holder.swap(snapshot)
+        # Предыдущую версию еще могут читать воркеры, не успевшие
+        # переключиться, поэтому удаляются только более старые
+        task = asyncio.create_task(self._drop_old_versions(previous_version))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        await progress.finish()
+        return version
+
+    @property
+    def _versioned_collections(self) -> list[MongoStorage]:
+        """Коллекции, которые создаются для каждой версии модели."""
+        return [
+            self.user_movie_collection,
+            self.similarity_collection,
+            self.movie_similarity_collection,
+            self.model_factors_collection,
+            self.new_movies_collection,
+            self.user_recommendations_collection,
+        ]
+
+    async def _drop_old_versions(self, previous_version: str | None) -> None:
+        """Удаление коллекций версий старше предыдущей.
+
+        Коллекции без версии (до перехода на версионирование) удаляются,
+        как только предыдущая версия тоже версионирована.
+        """
+        if previous_version is None:
+            return
+        try:
+            for collection in self._versioned_collections:
+                for version in await collection.list_versions():
+                    if version < previous_version:
+                        await collection.versioned(version).drop()
+                await collection.drop()
+        except Exception as e:
+            logger.error(f"Ошибка при удалении старых версий матриц: {e}")
+
+    def _is_incremental_refresh(self, version_data: dict) -> bool:
+        """Можно ли обновить матрицы инкрементально.
+
+        Факторы als зависят от всех оценок и всегда обучаются заново.
+        """
+        full_refreshed_at = version_data.get("full_refreshed_at") or 0
+        engine = settings.recommendations_engine
+        return bool(
+            settings.incremental_refresh
+            and engine != ALS
+            and version_data.get("ugc_high_water_mark")
+            and version_data.get("engine", USER_USER) == engine
+            and version_data.get("similarity_top_k")
+            == self._get_similarity_top_k(engine)
+            and time.time() - full_refreshed_at
+            < settings.full_refresh_interval
+        )
+
+    @staticmethod
+    def _get_similarity_top_k(engine: str) -> int:
+        """Сколько соседей хранить для алгоритма ``engine`` (als соседей
+        не хранит)."""
+        if engine == ALS:
+            return 0
+        if engine == ITEM_ITEM:
+            return settings.movie_similarity_top_k
+        return settings.similarity_top_k
+
+    def _get_model_collection(self, engine: str) -> MongoStorage:
+        """Коллекция модели алгоритма ``engine``."""
+        if engine == ALS:
+            return self.model_factors_collection
+        if engine == ITEM_ITEM:
+            return self.movie_similarity_collection
+        return self.similarity_collection
+
+    async def get_recommendations(self, user_id: str) -> list[FilmShort]:
+        """Получение списка рекомендаций с учетом лучших фильмов.
+
+        Этапы запроса (снимок матриц, расчет, данные фильмов) выборочно
+        замеряются в serving_metrics.
+        """
+        timer = serving_metrics.request("recommendations")
+        try:
+            with timer.stage("total"):
+                # получение снимка матриц
+                with timer.stage("snapshot"):
+                    snapshot = await self._get_snapshot()
+                with timer.stage("score"):
+                    movies_uuid = await self._get_user_movies_uuid(
+                        snapshot, user_id
+                    )
+                # получаем данные по фильмам из movies
+                with timer.stage("movies"):
+                    movies_data = await self._get_movies_data(movies_uuid)
+                # сортируем результат
+                recommendations = self._sort_movies(movies_uuid, movies_data)
             return recommendations
 
         except KeyError as exc:
             raise UserNotFoundtExeption from exc
 
+    async def _get_user_movies_uuid(
+        self, snapshot: MatrixSnapshot, user_id: str
+    ) -> list[str]:
+        """Список UUID рекомендованных пользователю фильмов.
+
+        :raises KeyError: пользователя нет в модели и общего списка нет
+        """
+        movies_uuid = None
+        # пользователь без оценок (холодный старт): общий список
+        # популярных фильмов и новинок, без расчета по матрицам
+        if not snapshot.has_user(user_id):
+            movies_uuid = snapshot.fallback_movies.tolist()
+            if not movies_uuid:
+                raise KeyError(user_id)
+        if movies_uuid is None and settings.precompute_recommendations:
+            movies_uuid = await self._fetch_precomputed_recommendations(
+                snapshot, user_id
+            )
+        if movies_uuid is None:
+            movies_uuid = await self._compute_recommendations(
+                snapshot, user_id
+            )
+        return movies_uuid[: settings.num_recommendations]
+
+    async def stream_batch_recommendations(
+        self, user_ids: list[str]
+    ) -> AsyncIterator[str]:
+        """Рекомендации для группы пользователей в формате NDJSON.
+
+        Все пользователи считаются по одному снимку матриц блоками по
+        batch_block_size, данные фильмов запрашиваются из Movies одним
+        запросом на все рекомендованные фильмы. Строка ответа на каждого
+        пользователя в порядке запроса; пользователю, которого нет в
+        модели и для которого нет общего списка, -- пустой список.
+        Этапы запроса выборочно замеряются в serving_metrics.
+        """
+        timer = serving_metrics.request("batch")
+        with timer.stage("total"):
+            with timer.stage("snapshot"):
+                snapshot = await self._get_snapshot()
+            with timer.stage("score"):
+                movies_uuid_by_user = await self._get_batch_movies_uuid(
+                    snapshot, user_ids
+                )
+            with timer.stage("movies"):
+                movies_data = await self._get_movies_data(
+                    list(
+                        dict.fromkeys(chain.from_iterable(movies_uuid_by_user))
+                    )
+                )
+            movies_data_dict = {
+                str(movie_data["uuid"]): FilmShort.model_validate(
+                    movie_data
+                ).model_dump(mode="json")
+                for movie_data in movies_data
+            }
+            for user_id, movies_uuid in zip(user_ids, movies_uuid_by_user):
+                line = json.dumps(
+                    {
+                        "user_id": user_id,
+                        "movies": [
+                            movies_data_dict[movie_uuid]
+                            for movie_uuid in movies_uuid
+                            if movie_uuid in movies_data_dict
+                        ],
+                    }
+                )
+                yield line + "\n"
+
+    async def _get_batch_movies_uuid(
+        self, snapshot: MatrixSnapshot, user_ids: list[str]
+    ) -> list[list[str]]:
+        """Списки UUID фильмов для группы пользователей по снимку матриц."""
+        limit = settings.num_recommendations
+        fallback_movies = snapshot.fallback_movies.tolist()
+        movies_uuid_by_user = [fallback_movies] * len(user_ids)
+        known = [
+            (position, snapshot.user_row(user_id))
+            for position, user_id in enumerate(user_ids)
+            if snapshot.has_user(user_id)
+        ]
+        best_movies_list = snapshot.best_movies_list()
+        new_movies_list = snapshot.new_movies_list()
+        block_size = max(settings.batch_block_size, 1)
+        for start in range(0, len(known), block_size):
+            block = known[start : start + block_size]
+            user_rows = np.array([user_row for _, user_row in block])
+            # расчет блока занимает заметное время: выполняем его вне
+            # цикла событий
+            recommended_movies = await asyncio.to_thread(
+                score_snapshot_users, snapshot, user_rows
+            )
+            for (position, _), movies in zip(block, recommended_movies):
+                movies_uuid_by_user[position] = get_uuid_list(
+                    snapshot.rating_matrix.movie_ids[movies].tolist(),
+                    best_movies_list,
+                    new_movies_list,
+                )[:limit]
+        return movies_uuid_by_user
+
+    async def _compute_recommendations(
+        self, snapshot: MatrixSnapshot, user_id: str
+    ) -> list[str]:
+        """Расчет списка UUID фильмов для пользователя по снимку матриц."""
+        (movies_uuid,) = get_movies_uuid(
+            snapshot,
+            np.array([snapshot.user_row(user_id)]),
+            snapshot.best_movies_list(),
+            snapshot.new_movies_list(),
+        )
+        return movies_uuid
+
+    @staticmethod
+    def _get_movie_lists(
+        rating_matrix: RatingMatrix, new_movies_list: list[str]
+    ) -> dict[str, np.ndarray]:
+        """Списки фильмов версии модели, не зависящие от пользователя.
+
+        :return: dict - лучшие фильмы, новинки и список рекомендаций для
+            пользователей без оценок
+        """
+        best_movies = RecommendationsService._get_average_ratings(
+            rating_matrix
+        )
+        limit = settings.num_recommendations
+        fallback_movies = get_uuid_list(
+            [], best_movies[:limit].tolist(), new_movies_list[:limit]
+        )[:limit]
+        return {
+            "best_movies": best_movies,
+            "new_movies": np.asarray(new_movies_list, dtype=str),
+            "fallback_movies": np.asarray(fallback_movies, dtype=str),
+        }
+
+    async def _store_precomputed_recommendations(
+        self, snapshot: MatrixSnapshot
+    ) -> None:
+        """Расчет и сохранение рекомендаций для всех пользователей."""
+        recommendations_records = await run_cpu_bound(
+            build_recommendations_records, snapshot
+        )
+        await self.user_recommendations_collection.versioned(
+            snapshot.version
+        ).insert_many(recommendations_records)
+
+    async def _fetch_precomputed_recommendations(
+        self, snapshot: MatrixSnapshot, user_id: str
+    ) -> list[str] | None:
+        """Получение предрассчитанного списка UUID фильмов пользователя."""
+        recommendations_data = (
+            await self.user_recommendations_collection.versioned(
+                snapshot.version
+            ).get_by_id({"_id": user_id})
+        )
+        if not recommendations_data:
+            return None
+        return recommendations_data["movies"]
+
     async def _get_all_movies_uuid(self) -> list[str]:
         """Получение всех UUID фильмоы из movies."""
-        async with ClientSession() as session:
-            try:
-                async with session.get(settings.movies_uuid_endpoint) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    return data
-            except Exception as e:
-                logger.error(f"Ошибка при получение всех UUID фильмоы из Movies: {e}")
-                return []
-
-    async def _get_new_movies_list(self, user_movie_matrix) -> list[str]:
+        try:
+            data = await self._request_json(
+                "GET", settings.movies_uuid_endpoint
+            )
+            return data
+        except Exception as e:
+            logger.error(
+                f"Ошибка при получение всех UUID фильмоы из Movies: {e}"
+            )
+            return []
+
+    @http_retry
+    async def _request_json(self, method: str, url: str, **kwargs):
+        """Запрос через общий HTTP-клиент с повторами при ошибках."""
+        async with self.http_session.request(
+            method, url, **kwargs
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def _get_new_movies_list(self, movie_ids: list[str]) -> list[str]:
         """Получение списка киноновинок."""
         # получаем список всех фильмов в movies
         all_movies = await self._get_all_movies_uuid()
-        # получаем список всех фильмов, на которые есть отзывы
-        movie_ids = user_movie_matrix.columns.tolist()
         # Преобразование списка UUID фильмов из all_movies в множество
         all_movies_set = set(all_movies)
         # Преобразование списка movie_ids в множество
         movie_ids_set = set(movie_ids)
         # Получение списка фильмов, которые есть в all_movies, но отсутствуют в movie_ids
-        new_movies_list = list(all_movies_set - movie_ids_set)
+        # (в порядке _id, как их возвращает distinct из коллекции)
+        new_movies_list = sorted(all_movies_set - movie_ids_set)
         return new_movies_list
 
-    def _get_uuid_list(
-        self, recommended_movies_list, best_movies_list, new_movies_list
-    ) -> list[str]:
-        """Получение списка UUID фильмов для рекомендаций."""
-        min_recommendations = (
-            settings.num_recommendations
-            - settings.min_best_movies_in_recommendations
-            - settings.min_new_movies_in_recommendations
-        )
-        movies_uuid = []
-        # Добавляем фильмы из recommended_movies_list
-        movies_uuid.extend(recommended_movies_list[:min_recommendations])
-        # Добавляем фильмы из best_movies_list
-        movies_uuid.extend(
-            best_movies_list[: settings.min_best_movies_in_recommendations]
-        )
-        # Добавляем фильмы из new_movies_list
-        movies_uuid.extend(
-            new_movies_list[: settings.min_new_movies_in_recommendations]
-        )
+    @staticmethod
+    def _get_average_ratings(rating_matrix: RatingMatrix) -> np.ndarray:
+        """Получение списка UUID фильмов отсортированных по рейтингу.
 
-        # Если какой-то из списков пуст или содержит меньше требуемого количества,
-        # добавляем фильмы из других списков
-        total_movies = len(movies_uuid)
-        if total_movies < settings.num_recommendations:
-            need_to_add = settings.num_recommendations - total_movies
-            if (
-                need_to_add
-                <= len(recommended_movies_list) - min_recommendations
-            ):
-                movies_uuid.extend(
-                    recommended_movies_list[
-                        min_recommendations : min_recommendations + need_to_add
-                    ]
-                )
-                need_to_add = 0
-            else:
-                movies_uuid.extend(
-                    recommended_movies_list[min_recommendations:]
-                )
-                need_to_add -= (
-                    len(recommended_movies_list) - min_recommendations
-                )
-
-            if need_to_add > 0 and best_movies_list:
-                movies_uuid.extend(best_movies_list[:need_to_add])
-                need_to_add = max(0, need_to_add - len(best_movies_list))
-
-            if need_to_add > 0 and new_movies_list:
-                movies_uuid.extend(new_movies_list[:need_to_add])
-
-        return movies_uuid
-
-    def _get_average_ratings(self, user_movie_matrix) -> list[str]:
-        """Получение списка UUID фильмов отсортированных по рейтингу."""
+        Рассчитывается один раз на версию модели и хранится в снимке.
+        """
         # Вычисление среднего рейтинга для каждого фильма
-        average_ratings = user_movie_matrix.mean()
-        # Преобразование результатов в словарь
-        average_ratings_dict = average_ratings.to_dict()
-        # Сортировка фильмов по среднему рейтингу в порядке убывания
-        sorted_movies = sorted(
-            average_ratings_dict.items(), key=lambda x: x[1], reverse=True
+        # (неоцененные фильмы считаются с рейтингом 0)
+        n_users = max(rating_matrix.shape[0], 1)
+        average_ratings = (
+            np.asarray(rating_matrix.ratings.sum(axis=0)).ravel() / n_users
         )
-        # Возвращаем список UUID фильмов в порядке убывания среднего рейтинга
-        sorted_movie_uuids = [movie_id for movie_id, _ in sorted_movies]
-        return sorted_movie_uuids
+        # Сортировка фильмов по среднему рейтингу в порядке убывания
+        # (при равном рейтинге -- в порядке UUID)
+        order = np.argsort(-average_ratings, kind="stable")
+        return rating_matrix.movie_ids[order]
 
     def _sort_movies(
         self, movies_uuid: list[str], movies_data: list[FilmShort]
@@ -231,105 +590,371 @@ class RecommendationsService:
         }
 
         # Создаем список рекомендаций из данных фильмов в нужном порядке
+        # (фильмы, которых нет в Movies, пропускаем)
         recommendations = [
-            movies_data_dict[movie_uuid] for movie_uuid in movies_uuid
+            movies_data_dict[movie_uuid]
+            for movie_uuid in movies_uuid
+            if movie_uuid in movies_data_dict
         ]
 
         return recommendations
 
-    async def _fetch_movies_data(self, endpoint):
-        """Получение данных из UGC"""
-        async with ClientSession() as session:
-            try:
-                async with session.get(endpoint) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    return data
-            except Exception as e:
-                logger.error(f"Ошибка при получении данных из UGC: {e}")
-                return []
+    async def _fetch_likes(
+        self, updated_since: str | None = None
+    ) -> UgcLikesParser | None:
+        """Потоковое получение лайков фильмов из UGC.
+
+        Ответ не буферизуется целиком: куски NDJSON разбираются по мере
+        получения.
+
+        :param updated_since: str | None - только фильмы, лайки которых
+            менялись с этого момента
+        :return: UgcLikesParser | None - разобранные лайки или None при
+            ошибке получения
+        """
+        try:
+            return await self._stream_likes(updated_since)
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных из UGC: {e}")
+            return None
+
+    @http_retry
+    async def _stream_likes(self, updated_since: str | None) -> UgcLikesParser:
+        """Одна попытка чтения потока лайков (повтор начинает поток заново)."""
+        likes = UgcLikesParser()
+        params = {"updated_since": updated_since} if updated_since else None
+        # общий таймаут не ограничивает весь поток: ограничено только
+        # ожидание очередного куска
+        timeout = ClientTimeout(
+            total=None,
+            connect=settings.http_connect_timeout,
+            sock_read=settings.http_timeout,
+        )
+        async with self.http_session.get(
+            settings.ugc_likes_endpoint, params=params, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(UGC_CHUNK_SIZE):
+                likes.feed(chunk)
+            likes.close()
+        return likes
+
+    async def _get_movies_data(
+        self, movies_uuid: list[str]
+    ) -> list[FilmShort]:
+        """Получение данных по фильмам с учетом кэша.
+
+        В Movies запрашиваются только фильмы, которых нет в кэше.
+        """
+        cached, missing = film_cache.get_many(movies_uuid)
+        if missing:
+            fetched = await self._fetch_movies_data_by_uuid(missing)
+            if fetched is not None:
+                fetched_dict = {
+                    str(movie_data["uuid"]): movie_data
+                    for movie_data in fetched
+                }
+                for movie_uuid in missing:
+                    movie_data = fetched_dict.get(movie_uuid)
+                    film_cache.put(movie_uuid, movie_data)
+                    cached[movie_uuid] = movie_data
+        return [
+            movie_data
+            for movie_data in cached.values()
+            if movie_data is not None
+        ]
 
     async def _fetch_movies_data_by_uuid(
         self, movies_uuid: list
-    ) -> list[FilmShort]:
-        """Получение данных по фильмам из Movies"""
-        async with ClientSession() as session:
-            try:
-                async with session.post(
-                    settings.movies_endpoint, json=movies_uuid
-                ) as response:
-                    data = await response.json()
-                    return data
-            except Exception as e:
-                logger.error(f"Ошибка при получении данных по фильмам из Movies: {e}")
-                return []
-
-    def _process_data(self, raw_data):
-        """Преобразование данных в DataFrame."""
-        users = []
-        movies = []
-        ratings = []
-
-        for movie in raw_data:
-            movie_id = movie["_id"]
-            if "likes" in movie:
-                for like in movie["likes"]:
-                    users.append(like["user_id"])
-                    movies.append(movie_id)
-                    ratings.append(like["rating"])
-
-        df = pd.DataFrame(
-            {"user_id": users, "movie_id": movies, "rating": ratings}
-        )
-        return df
-
-    async def _fetch_matrices(self):
-        """Получение матриц из хранилища."""
-        # Извлечение user_movie_matrix
-        user_movie_data = await self.user_movie_collection.get_list()
-        # Создаем список словарей
-        data_list = []
-        for user in user_movie_data:
-            for movie in user["movies"]:
-                data_list.append(
-                    {
-                        "user_id": user["_id"],
-                        "movie_id": movie["movie_id"],
-                        "rating": movie["rating"],
-                    }
+    ) -> list[FilmShort] | None:
+        """Получение данных по фильмам из Movies (None -- при ошибке)"""
+        try:
+            data = await self._request_json(
+                "POST", settings.movies_endpoint, json=movies_uuid
+            )
+            return data
+        except Exception as e:
+            logger.error(
+                f"Ошибка при получении данных по фильмам из Movies: {e}"
+            )
+            return None
+
+    async def _get_snapshot(self) -> MatrixSnapshot:
+        """Получение снимка матриц для запроса.
+
+        Пока снимка нет (первый запрос процесса), запрос ждет его
+        загрузки. Дальше запросы сразу получают текущий снимок; раз в
+        snapshot_check_interval версия сверяется с хранилищем в одной
+        фоновой задаче, и до загрузки новой версии запросы обслуживаются
+        прежним снимком.
+        """
+        snapshot = snapshot_holder.snapshot
+        if snapshot is None:
+            return await self._load_current_snapshot()
+        if snapshot_holder.is_stale() and (
+            snapshot_holder.refresh_task is None
+            or snapshot_holder.refresh_task.done()
+        ):
+            snapshot_holder.refresh_task = asyncio.create_task(
+                self._refresh_snapshot()
+            )
+        return snapshot
+
+    async def _refresh_snapshot(self) -> None:
+        """Фоновая сверка версии и загрузка нового снимка."""
+        try:
+            await self._load_current_snapshot()
+        except Exception as e:
+            # следующая попытка -- через snapshot_check_interval
+            snapshot_holder.mark_checked()
+            logger.error(f"Ошибка при загрузке снимка матриц: {e}")
+
+    async def _load_current_snapshot(self) -> MatrixSnapshot:
+        """Снимок активной версии модели, загруженный при необходимости.
+
+        Снимок загружается из хранилища один раз на версию модели;
+        версия сверяется не чаще, чем раз в snapshot_check_interval.
+        """
+        if not snapshot_holder.is_stale():
+            return snapshot_holder.snapshot
+        async with snapshot_holder.lock:
+            # снимок мог обновить другой запрос, пока мы ждали блокировку
+            if not snapshot_holder.is_stale():
+                return snapshot_holder.snapshot
+            version_data = await self.version_collection.get_by_id(
+                {"_id": MODEL_VERSION_ID}
+            )
+            version = version_data["version"] if version_data else None
+            current = snapshot_holder.snapshot
+            if current is not None and current.version == version:
+                snapshot_holder.mark_checked()
+                return current
+            snapshot = None
+            if version is not None:
+                snapshot = await asyncio.to_thread(
+                    load_snapshot, settings.snapshot_dir, version
+                )
+            if snapshot is None:
+                snapshot = await self._load_snapshot(
+                    version,
+                    (version_data or {}).get("engine", USER_USER),
                 )
-        # Создаем DataFrame из списка словарей
-        user_movie_df = pd.DataFrame(data_list)
-        user_movie_matrix = user_movie_df.pivot(
-            index="user_id", columns="movie_id", values="rating"
+            snapshot_holder.swap(snapshot)
+            logger.info(f"Загружен снимок матриц версии {version}")
+            return snapshot
+
+    async def _load_snapshot(
+        self, version: str | None, engine: str = USER_USER
+    ) -> MatrixSnapshot:
+        """Загрузка снимка матриц из коллекций Mongo.
+
+        Используется, если бинарного снимка этой версии нет на диске.
+        Документы разбираются в отдельном потоке, не блокируя цикл
+        событий.
+        """
+        user_movie_data = await self.user_movie_collection.versioned(
+            version
+        ).get_list()
+        model_data = (
+            await self._get_model_collection(engine)
+            .versioned(version)
+            .get_list()
         )
-        # Извлечение similarity_matrix
-        similarity_data = await self.similarity_collection.get_list()
-        # Создаем список словарей
-        data_list = []
-        for user in similarity_data:
-            for similar_user in user["similar_users"]:
-                data_list.append(
-                    {
-                        "user_id": user["_id"],
-                        "other_user": similar_user["user_id"],
-                        "similarity": similar_user["similarity"],
-                    }
+        new_movies_list = await self.new_movies_collection.versioned(
+            version
+        ).distinct("_id")
+        return await asyncio.to_thread(
+            self._read_snapshot,
+            version,
+            engine,
+            user_movie_data,
+            model_data,
+            new_movies_list,
+        )
+
+    @staticmethod
+    def _read_snapshot(
+        version: str | None,
+        engine: str,
+        user_movie_data: list[dict],
+        model_data: list[dict],
+        new_movies_list: list[str],
+    ) -> MatrixSnapshot:
+        """Снимок матриц из документов коллекций версии ``version``."""
+        rating_matrix = RecommendationsService._read_rating_matrix(
+            user_movie_data
+        )
+        if engine == ALS:
+            # Извлечение латентных факторов
+            model_arrays = RecommendationsService._read_factors(
+                model_data, rating_matrix
+            )
+        elif engine == ITEM_ITEM:
+            # Извлечение похожих фильмов
+            (
+                movie_neighbours,
+                movie_weights,
+            ) = RecommendationsService._read_neighbours(
+                model_data,
+                rating_matrix.movie_ids,
+                "similar_movies",
+                "movie_id",
+            )
+            model_arrays = {
+                "movie_neighbours": movie_neighbours,
+                "movie_neighbour_weights": movie_weights,
+            }
+        else:
+            if version is None:
+                # модель, построенная до версионирования
+                model_data = RecommendationsService._read_legacy_similarity(
+                    model_data
                 )
-        similarity_df = pd.DataFrame(data_list)
-        similarity_matrix = similarity_df.pivot(
-            index="user_id", columns="other_user", values="similarity"
+            # Извлечение соседей пользователей
+            neighbours, weights = RecommendationsService._read_neighbours(
+                model_data,
+                rating_matrix.user_ids,
+                "similar_users",
+                "user_id",
+            )
+            model_arrays = {
+                "neighbours": neighbours,
+                "neighbour_weights": weights,
+            }
+        return MatrixSnapshot(
+            version=version,
+            rating_matrix=rating_matrix,
+            engine=engine,
+            **model_arrays,
+            **RecommendationsService._get_movie_lists(
+                rating_matrix, new_movies_list
+            ),
+        )
+
+    @staticmethod
+    def _read_factors(
+        model_data: list[dict], rating_matrix: RatingMatrix
+    ) -> dict[str, np.ndarray]:
+        """Факторы пользователей и фильмов из документов model_factors."""
+        factors = {}
+        for document in model_data:
+            kind, row_id = document["_id"].split(":", 1)
+            factors[kind, row_id] = document["factors"]
+        n_factors = len(next(iter(factors.values()), []))
+        model_arrays = {}
+        for kind, ids in (
+            ("user", rating_matrix.user_ids),
+            ("movie", rating_matrix.movie_ids),
+        ):
+            array = np.zeros((len(ids), n_factors), np.float32)
+            for row, row_id in enumerate(ids):
+                if (kind, row_id) in factors:
+                    array[row] = factors[kind, row_id]
+            model_arrays[f"{kind}_factors"] = array
+        return model_arrays
+
+    @staticmethod
+    def _read_neighbours(
+        similarity_data: list[dict],
+        ids: np.ndarray,
+        list_key: str,
+        id_key: str,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Матрицы соседей и их similarity из документов коллекции сходства.
+
+        :param similarity_data: list[dict] - документы коллекции сходства
+        :param ids: np.ndarray - id строк матрицы (пользователей или фильмов)
+        :param list_key: str - поле документа со списком соседей
+        :param id_key: str - поле id соседа в элементе списка
+        """
+        index = {row_id: row for row, row_id in enumerate(ids)}
+        n_neighbours = max(
+            (len(document[list_key]) for document in similarity_data),
+            default=0,
         )
-        return user_movie_matrix, similarity_matrix
+        neighbours = np.zeros((len(index), n_neighbours), np.int64)
+        weights = np.zeros((len(index), n_neighbours), np.float64)
+        for document in similarity_data:
+            row = index.get(document["_id"])
+            if row is None:
+                continue
+            for position, neighbour in enumerate(document[list_key]):
+                neighbours[row, position] = index[neighbour[id_key]]
+                weights[row, position] = neighbour["similarity"]
+        return neighbours, weights
+
+    @staticmethod
+    def _read_legacy_similarity(similarity_data: list[dict]) -> list[dict]:
+        """Документы user_similarity прежнего формата в формате top-K.
+
+        Прежние документы перечисляют всех пользователей, включая самого
+        пользователя, в порядке id. Остаются similarity_top_k соседей по
+        убыванию similarity без самого пользователя; при равных
+        similarity сохраняется порядок документа.
+        """
+        return [
+            {
+                "_id": document["_id"],
+                "similar_users": heapq.nlargest(
+                    settings.similarity_top_k,
+                    (
+                        neighbour
+                        for neighbour in document["similar_users"]
+                        if neighbour["user_id"] != document["_id"]
+                    ),
+                    key=lambda neighbour: neighbour["similarity"],
+                ),
+            }
+            for document in similarity_data
+        ]
+
+    @staticmethod
+    def _read_rating_matrix(user_movie_data: list[dict]) -> RatingMatrix:
+        """Матрица "пользователь-фильм" из документов user_movie_matrix.
+
+        Документы хранят только ненулевые оценки параллельными массивами
+        movie_ids и ratings, из которых строки матрицы собираются
+        напрямую. Документы прежнего формата (список movies со всеми
+        фильмами, включая нулевые оценки) тоже читаются.
+        """
+        user_ids = []
+        row_movies = []
+        row_ratings = []
+        for user in user_movie_data:
+            user_ids.append(user["_id"])
+            if "movies" in user:
+                movies = [movie for movie in user["movies"] if movie["rating"]]
+                row_movies.append([movie["movie_id"] for movie in movies])
+                row_ratings.append([movie["rating"] for movie in movies])
+            else:
+                row_movies.append(user["movie_ids"])
+                row_ratings.append(user["ratings"])
+        return build_rating_matrix_from_rows(user_ids, row_movies, row_ratings)
 
 
 def get_recommendations_service(
     user_movie_collection: MongoStorage = Depends(get_user_movie_storage),
     similarity_collection: MongoStorage = Depends(get_similarity_storage),
+    movie_similarity_collection: MongoStorage = Depends(
+        get_movie_similarity_storage
+    ),
+    model_factors_collection: MongoStorage = Depends(
+        get_model_factors_storage
+    ),
     new_movies_collection: MongoStorage = Depends(get_new_movies_storage),
+    version_collection: MongoStorage = Depends(get_model_version_storage),
+    user_recommendations_collection: MongoStorage = Depends(
+        get_user_recommendations_storage
+    ),
+    http_session: ClientSession = Depends(get_http_session),
 ) -> RecommendationsService:
     return RecommendationsService(
         user_movie_collection=user_movie_collection,
         similarity_collection=similarity_collection,
+        movie_similarity_collection=movie_similarity_collection,
+        model_factors_collection=model_factors_collection,
         new_movies_collection=new_movies_collection,
+        version_collection=version_collection,
+        user_recommendations_collection=user_recommendations_collection,
+        http_session=http_session,
     )
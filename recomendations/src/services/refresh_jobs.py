@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from fastapi import Depends
+
+from core.config import settings
+from core.models import RefreshJob
+from services.mongo_storage import (
+    MongoStorage,
+    get_model_version_storage,
+    get_refresh_jobs_storage,
+)
+from services.progress import RefreshProgress
+from services.recommendations import (
+    MODEL_VERSION_ID,
+    RecommendationsService,
+    background_tasks,
+    get_recommendations_service,
+)
+
+logger = logging.getLogger(__name__)
+
+# _id документа-блокировки в коллекции refresh_jobs: id выполняемой задачи
+# и время, до которого блокировка действительна
+LOCK_ID = "lock"
+
+
+class RefreshJobsService:
+    """Фоновые задачи обновления матриц.
+
+    Одновременно выполняется не больше одной задачи на все воркеры:
+    задача захватывает документ-блокировку, а запуски во время ее
+    выполнения возвращают ту же задачу. Состояние задач хранится в
+    коллекции refresh_jobs.
+    """
+
+    def __init__(
+        self,
+        jobs_collection: MongoStorage,
+        version_collection: MongoStorage,
+        recommendations_service: RecommendationsService,
+    ) -> None:
+        self.jobs_collection = jobs_collection
+        self.version_collection = version_collection
+        self.recommendations_service = recommendations_service
+
+    async def start_job(self) -> RefreshJob:
+        """Запуск обновления матриц или получение уже выполняемой задачи."""
+        job_id = str(uuid4())
+        lock = await self.jobs_collection.find_one_and_upsert(
+            {
+                "_id": LOCK_ID,
+                "$or": [
+                    {"job_id": None},
+                    {"expires_at": {"$lt": time.time()}},
+                ],
+            },
+            {"$set": self._lock_data(job_id)},
+        )
+        if lock is None:
+            lock = await self.jobs_collection.get_by_id({"_id": LOCK_ID})
+            if not lock or not lock["job_id"]:
+                # задача завершилась, пока проверялась блокировка
+                return await self.start_job()
+            logger.info(f"Обновление матриц уже выполняется: {lock['job_id']}")
+            job = await self.get_job(lock["job_id"])
+            # задача могла еще не успеть сохранить свое состояние
+            return job or RefreshJob(
+                job_id=lock["job_id"],
+                status="queued",
+                created_at=datetime.now(tz=timezone.utc),
+            )
+        await self.jobs_collection.upsert_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "queued",
+                    "stages": {},
+                    "metrics": {},
+                    "created_at": datetime.now(tz=timezone.utc),
+                }
+            },
+        )
+        task = asyncio.create_task(self._run_job(job_id))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        return await self.get_job(job_id)
+
+    async def get_job(self, job_id: str) -> RefreshJob | None:
+        """Состояние задачи обновления матриц."""
+        if job_id == LOCK_ID:
+            return None
+        job_data = await self.jobs_collection.get_by_id({"_id": job_id})
+        if not job_data:
+            return None
+        version_data = await self.version_collection.get_by_id(
+            {"_id": MODEL_VERSION_ID}
+        )
+        return RefreshJob(
+            job_id=job_data.pop("_id"),
+            last_success_version=(
+                version_data["version"] if version_data else None
+            ),
+            **job_data,
+        )
+
+    async def get_last_job(self) -> RefreshJob | None:
+        """Состояние последней завершенной задачи обновления матриц."""
+        lock = await self.jobs_collection.get_by_id({"_id": LOCK_ID})
+        if not lock or not lock.get("last_job_id"):
+            return None
+        return await self.get_job(lock["last_job_id"])
+
+    async def _run_job(self, job_id: str) -> None:
+        async def on_change(progress: RefreshProgress) -> None:
+            # каждый этап продлевает блокировку
+            await self.jobs_collection.update_one(
+                {"_id": job_id},
+                {
+                    "$set": {
+                        "phase": progress.phase,
+                        "stages": progress.stages,
+                        "metrics": progress.metrics,
+                    }
+                },
+            )
+            await self.jobs_collection.update_one(
+                {"_id": LOCK_ID, "job_id": job_id},
+                {"$set": self._lock_data(job_id)},
+            )
+
+        job_data = {"status": "running"}
+        await self.jobs_collection.update_one(
+            {"_id": job_id}, {"$set": job_data}
+        )
+        try:
+            version = await self.recommendations_service.refresh_matrices(
+                RefreshProgress(on_change)
+            )
+            job_data = {"status": "succeeded", "version": version}
+        except Exception as e:
+            logger.exception(f"Ошибка при обновлении матриц: {e}")
+            job_data = {"status": "failed", "error": str(e) or repr(e)}
+        finally:
+            job_data["finished_at"] = datetime.now(tz=timezone.utc)
+            await self.jobs_collection.update_one(
+                {"_id": job_id}, {"$set": job_data}
+            )
+            await self.jobs_collection.update_one(
+                {"_id": LOCK_ID, "job_id": job_id},
+                {"$set": {"job_id": None, "last_job_id": job_id}},
+            )
+
+    @staticmethod
+    def _lock_data(job_id: str) -> dict:
+        return {
+            "job_id": job_id,
+            "expires_at": time.time() + settings.refresh_job_timeout,
+        }
+
+
+def get_refresh_jobs_service(
+    jobs_collection: MongoStorage = Depends(get_refresh_jobs_storage),
+    version_collection: MongoStorage = Depends(get_model_version_storage),
+    recommendations_service: RecommendationsService = Depends(
+        get_recommendations_service
+    ),
+) -> RefreshJobsService:
+    return RefreshJobsService(
+        jobs_collection=jobs_collection,
+        version_collection=version_collection,
+        recommendations_service=recommendations_service,
+    )
@@ -0,0 +1,365 @@
+from itertools import chain
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from core.config import settings
+from services.snapshot import ALS, ITEM_ITEM, MatrixSnapshot
+
+
+def score_user(
+    ratings: csr_matrix,
+    user_row: int,
+    neighbours: np.ndarray,
+    weights: np.ndarray,
+    top_n: int,
+) -> np.ndarray:
+    """Векторизованный расчет рекомендаций пользователю по его соседям.
+
+    Оценка фильма -- сумма ``similarity * rating`` по соседям, то есть одно
+    произведение вектора весов на строки соседей. Кандидаты -- фильмы,
+    оцененные хотя бы одним соседом и не оцененные самим пользователем.
+    При равных оценках порядок совпадает с порядком первого появления
+    фильма при обходе соседей.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param user_row: int - строка целевого пользователя
+    :param neighbours: np.ndarray - строки соседей по убыванию similarity
+    :param weights: np.ndarray - similarity соседей
+    :param top_n: int - сколько фильмов вернуть
+    :return: np.ndarray - индексы столбцов (фильмов) по убыванию оценки
+    """
+    neighbour_ratings = ratings[neighbours]
+    scores = neighbour_ratings.T @ weights
+    # позиция первого появления фильма при обходе соседей по порядку
+    candidates, first_seen = np.unique(
+        neighbour_ratings.indices, return_index=True
+    )
+    not_seen = ~np.isin(
+        candidates,
+        ratings.indices[
+            ratings.indptr[user_row] : ratings.indptr[user_row + 1]
+        ],
+    )
+    candidates = candidates[not_seen]
+    first_seen = first_seen[not_seen]
+    candidate_scores = scores[candidates]
+    if len(candidates) > top_n:
+        # частичная сортировка: оставляем всех, кто не хуже top_n-го,
+        # чтобы не потерять равные на границе
+        threshold = np.partition(candidate_scores, -top_n)[-top_n]
+        keep = candidate_scores >= threshold
+        candidates = candidates[keep]
+        first_seen = first_seen[keep]
+        candidate_scores = candidate_scores[keep]
+    order = np.lexsort((first_seen, -candidate_scores))
+    return candidates[order][:top_n]
+
+
+def score_users(
+    ratings: csr_matrix,
+    user_rows: np.ndarray,
+    neighbours: np.ndarray,
+    weights: np.ndarray,
+    top_n: int,
+) -> list[np.ndarray]:
+    """Расчет рекомендаций сразу для группы пользователей.
+
+    Оценки всех пользователей группы -- одно произведение разреженной
+    матрицы весов соседей ``группа x n_users`` на матрицу оценок.
+    Результат для каждого пользователя совпадает с ``score_user``.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param user_rows: np.ndarray - строки пользователей группы
+    :param neighbours: np.ndarray - матрица ``группа x k`` строк соседей
+        по убыванию similarity
+    :param weights: np.ndarray - similarity соседей
+    :param top_n: int - сколько фильмов вернуть каждому пользователю
+    :return: list[np.ndarray] - индексы фильмов по убыванию оценки для
+        каждого пользователя группы
+    """
+    n_batch, k = neighbours.shape
+    # столбцы строки -- соседи пользователя в исходном порядке
+    neighbour_weights = csr_matrix(
+        (
+            np.asarray(weights, dtype=np.float64).ravel(),
+            np.asarray(neighbours).ravel(),
+            np.arange(0, n_batch * k + 1, k),
+        ),
+        shape=(n_batch, ratings.shape[0]),
+    )
+    return _score_rows(neighbour_weights, ratings, ratings[user_rows], top_n)
+
+
+def score_items(
+    ratings: csr_matrix,
+    user_rows: np.ndarray,
+    movie_similarity: csr_matrix,
+    top_n: int,
+) -> list[np.ndarray]:
+    """Расчет рекомендаций группе пользователей по похожим фильмам.
+
+    Оценка фильма -- сумма ``rating * similarity`` по оцененным
+    пользователем фильмам, в соседях которых он есть, то есть
+    произведение строк оценок группы на матрицу сходства фильмов.
+    При равных оценках порядок -- порядок первого появления при обходе
+    оцененных фильмов и их соседей.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param user_rows: np.ndarray - строки пользователей группы
+    :param movie_similarity: csr_matrix - ``n_movies x n_movies``, в строке
+        фильма -- похожие фильмы по убыванию similarity
+    :param top_n: int - сколько фильмов вернуть каждому пользователю
+    :return: list[np.ndarray] - индексы фильмов по убыванию оценки для
+        каждого пользователя группы
+    """
+    user_ratings = ratings[user_rows]
+    return _score_rows(user_ratings, movie_similarity, user_ratings, top_n)
+
+
+def score_factors(
+    ratings: csr_matrix,
+    user_rows: np.ndarray,
+    user_factors: np.ndarray,
+    movie_factors: np.ndarray,
+    top_n: int,
+) -> list[np.ndarray]:
+    """Расчет рекомендаций группе пользователей по латентным факторам.
+
+    Оценка фильма -- скалярное произведение факторов пользователя и
+    фильма, то есть одно произведение ``группа x factors`` на
+    ``factors x n_movies``. Оцененные пользователем фильмы исключаются;
+    при равных оценках порядок -- по номеру фильма.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param user_rows: np.ndarray - строки пользователей группы
+    :param user_factors: np.ndarray - факторы пользователей
+    :param movie_factors: np.ndarray - факторы фильмов
+    :param top_n: int - сколько фильмов вернуть каждому пользователю
+    :return: list[np.ndarray] - индексы фильмов по убыванию оценки для
+        каждого пользователя группы
+    """
+    n_batch = len(user_rows)
+    n_movies = movie_factors.shape[0]
+    if n_batch == 0:
+        return []
+    scores = user_factors[user_rows] @ movie_factors.T
+    seen = ratings[user_rows]
+    scores[
+        np.repeat(np.arange(n_batch), np.diff(seen.indptr)), seen.indices
+    ] = -np.inf
+    top_n = min(top_n, n_movies)
+    if top_n == 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(n_batch)]
+    # частичная сортировка: оставляем всех, кто не хуже top_n-го,
+    # чтобы не потерять равные на границе; оцененные фильмы (-inf)
+    # остаются, только если других не хватило, и отбрасываются ниже
+    threshold = -np.partition(-scores, top_n - 1, axis=1)[:, top_n - 1]
+    users, movies = np.nonzero(
+        (scores >= threshold[:, None]) & np.isfinite(scores)
+    )
+    order = np.lexsort((movies, -scores[users, movies], users))
+    users = users[order]
+    movies = movies[order]
+    starts = np.searchsorted(users, np.arange(n_batch + 1))
+    return [
+        movies[start : min(start + top_n, stop)]
+        for start, stop in zip(starts[:-1], starts[1:])
+    ]
+
+
+def score_snapshot_users(
+    snapshot: MatrixSnapshot, user_rows: np.ndarray
+) -> list[np.ndarray]:
+    """Индексы рекомендованных фильмов для строк пользователей
+    алгоритмом, которым построен снимок."""
+    ratings = snapshot.rating_matrix.ratings
+    if snapshot.engine == ALS:
+        # произведение факторов пользователя на факторы всех фильмов
+        return score_factors(
+            ratings,
+            user_rows,
+            snapshot.user_factors,
+            snapshot.movie_factors,
+            settings.num_recommendations,
+        )
+    if snapshot.engine == ITEM_ITEM:
+        # взвешенная сумма похожих фильмов по оценкам пользователя
+        return score_items(
+            ratings,
+            user_rows,
+            snapshot.movie_similarity,
+            settings.num_recommendations,
+        )
+    # Собираем рекомендации от схожих пользователей (соседи
+    # хранятся отсортированными): взвешенная сумма их оценок
+    # по фильмам, которые целевой пользователь не смотрел
+    neighbours = snapshot.neighbours[user_rows, : settings.num_similar_users]
+    weights = snapshot.neighbour_weights[
+        user_rows, : settings.num_similar_users
+    ]
+    if len(user_rows) == 1:
+        return [
+            score_user(
+                ratings,
+                int(user_rows[0]),
+                neighbours[0],
+                weights[0],
+                settings.num_recommendations,
+            )
+        ]
+    return score_users(
+        ratings,
+        user_rows,
+        neighbours,
+        weights,
+        settings.num_recommendations,
+    )
+
+
+def get_movies_uuid(
+    snapshot: MatrixSnapshot,
+    user_rows: np.ndarray,
+    best_movies_list: list[str],
+    new_movies_list: list[str],
+) -> list[list[str]]:
+    """Рекомендации группе пользователей по снимку матриц, дополненные
+    лучшими и новыми фильмами.
+
+    :param snapshot: MatrixSnapshot - снимок матриц
+    :param user_rows: np.ndarray - строки пользователей группы
+    :param best_movies_list: list[str] - лучшие фильмы по убыванию оценки
+    :param new_movies_list: list[str] - новые фильмы
+    :return: list[list[str]] - UUID фильмов для каждого пользователя
+    """
+    movie_ids = snapshot.rating_matrix.movie_ids
+    return [
+        get_uuid_list(
+            movie_ids[movies].tolist(), best_movies_list, new_movies_list
+        )
+        for movies in score_snapshot_users(snapshot, user_rows)
+    ]
+
+
+def get_uuid_list(
+    recommended_movies_list: list[str],
+    best_movies_list: list[str],
+    new_movies_list: list[str],
+) -> list[str]:
+    """Получение списка UUID фильмов для рекомендаций."""
+    min_recommendations = (
+        settings.num_recommendations
+        - settings.min_best_movies_in_recommendations
+        - settings.min_new_movies_in_recommendations
+    )
+    movies_uuid = []
+    # Добавляем фильмы из recommended_movies_list
+    movies_uuid.extend(recommended_movies_list[:min_recommendations])
+    # Добавляем фильмы из best_movies_list
+    movies_uuid.extend(
+        best_movies_list[: settings.min_best_movies_in_recommendations]
+    )
+    # Добавляем фильмы из new_movies_list
+    movies_uuid.extend(
+        new_movies_list[: settings.min_new_movies_in_recommendations]
+    )
+
+    # Если какой-то из списков пуст или содержит меньше требуемого
+    # количества, добавляем фильмы из других списков; фильм, который уже
+    # есть в списке, не повторяется
+    movies_uuid = list(dict.fromkeys(movies_uuid))
+    added = set(movies_uuid)
+    for movie_uuid in chain(
+        recommended_movies_list[max(0, min_recommendations) :],
+        best_movies_list,
+        new_movies_list,
+    ):
+        if len(movies_uuid) >= settings.num_recommendations:
+            break
+        if movie_uuid not in added:
+            added.add(movie_uuid)
+            movies_uuid.append(movie_uuid)
+
+    return movies_uuid
+
+
+def _score_rows(
+    weights: csr_matrix,
+    rows: csr_matrix,
+    seen: csr_matrix,
+    top_n: int,
+) -> list[np.ndarray]:
+    """Взвешенная сумма строк ``rows`` для каждого пользователя группы.
+
+    Оценки -- произведение ``weights @ rows``. Кандидаты -- фильмы,
+    которые есть хотя бы в одной взятой строке и которых нет в ``seen``;
+    при равных оценках порядок -- порядок первого появления при обходе
+    строк в порядке столбцов ``weights``.
+
+    :param weights: csr_matrix - веса строк ``rows``, строка на пользователя
+    :param rows: csr_matrix - строки, столбцы которых -- фильмы
+    :param seen: csr_matrix - фильмы, которые пользователям не рекомендуются
+    :param top_n: int - сколько фильмов вернуть каждому пользователю
+    :return: list[np.ndarray] - индексы фильмов по убыванию оценки
+    """
+    n_batch = weights.shape[0]
+    n_movies = rows.shape[1]
+    if n_batch == 0:
+        return []
+    scores = (weights @ rows).tocsr()
+    scores.sum_duplicates()
+    score_keys = (
+        np.repeat(np.arange(n_batch), np.diff(scores.indptr)) * n_movies
+        + scores.indices
+    )
+
+    # взятые строки всех пользователей подряд: пользователь, затем
+    # строка по порядку; кандидаты -- пары (пользователь, фильм), первое
+    # появление пары задает порядок при равных оценках
+    taken_rows = rows[weights.indices]
+    taken_users = np.repeat(np.arange(n_batch), np.diff(weights.indptr))
+    candidates, first_seen = np.unique(
+        np.repeat(taken_users, np.diff(taken_rows.indptr)) * n_movies
+        + taken_rows.indices,
+        return_index=True,
+    )
+    seen_keys = (
+        np.repeat(np.arange(n_batch), np.diff(seen.indptr)) * n_movies
+        + seen.indices
+    )
+    keep = ~np.isin(candidates, seen_keys)
+    candidates = candidates[keep]
+    first_seen = first_seen[keep]
+    # оценка кандидата (произведение не хранит нулевые суммы)
+    positions = np.minimum(
+        np.searchsorted(score_keys, candidates), max(len(score_keys) - 1, 0)
+    )
+    candidate_scores = np.zeros(len(candidates))
+    if len(score_keys):
+        found = score_keys[positions] == candidates
+        candidate_scores[found] = scores.data[positions[found]]
+
+    # узкий целочисленный тип: устойчивая сортировка по пользователю
+    # для него -- поразрядная
+    users = (candidates // n_movies).astype(np.min_scalar_type(n_batch))
+    # частичная сортировка: оценка top_n-го фильма каждого пользователя;
+    # оставляем всех, кто не хуже, чтобы не потерять равные на границе
+    by_score = np.argsort(-candidate_scores)
+    by_score = by_score[np.argsort(users[by_score], kind="stable")]
+    starts = np.searchsorted(users[by_score], np.arange(n_batch + 1))
+    not_empty = starts[1:] > starts[:-1]
+    last = np.minimum(starts[:-1] + top_n, starts[1:]) - 1
+    threshold = np.full(n_batch, np.inf)
+    threshold[not_empty] = candidate_scores[by_score[last[not_empty]]]
+    keep = candidate_scores >= threshold[users]
+    users = users[keep]
+    movies = candidates[keep] % n_movies
+    order = np.lexsort((first_seen[keep], -candidate_scores[keep], users))
+    users = users[order]
+    movies = movies[order]
+    # первые top_n фильмов каждого пользователя
+    starts = np.searchsorted(users, np.arange(n_batch + 1))
+    return [
+        movies[start : min(start + top_n, stop)]
+        for start, stop in zip(starts[:-1], starts[1:])
+    ]
@@ -0,0 +1,386 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from core.config import settings
+
+# Итераций k-means при построении кластеров приближенного индекса
+IVF_KMEANS_ITERATIONS = 5
+
+
+def _normalize_rows(ratings: csr_matrix) -> csr_matrix:
+    """Копия матрицы со строками единичной L2-нормы."""
+    # sklearn нужен только при обучении модели: импорт здесь, чтобы
+    # воркеры, обслуживающие запросы по снимку, его не загружали
+    from sklearn.preprocessing import normalize
+
+    return normalize(ratings, norm="l2", axis=1, copy=True).tocsr()
+
+
+def select_top_k(
+    similarity: np.ndarray,
+    k: int,
+    self_columns: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Выбор k наиболее похожих пользователей для каждой строки блока.
+
+    :param similarity: np.ndarray - блок матрицы сходства (строки -- пользователи
+        блока, столбцы -- кандидаты в соседи)
+    :param k: int - сколько соседей оставить
+    :param self_columns: np.ndarray | None - столбец самого пользователя для
+        каждой строки, чтобы исключить его из соседей (блок перезаписывается
+        на месте)
+    :return: номера столбцов соседей и их similarity, отсортированные
+        по убыванию
+    """
+    n_rows, n_cols = similarity.shape
+    block = similarity.astype(np.float64, copy=False)
+    available = n_cols
+    if self_columns is not None:
+        # исключаем самого пользователя
+        block[np.arange(n_rows), self_columns] = -np.inf
+        available -= 1
+    k = max(min(k, available), 0)
+    if k == 0:
+        empty = np.empty((n_rows, 0))
+        return empty.astype(np.int64), empty
+    if k < n_cols:
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n_cols), (n_rows, 1))
+    candidate_similarity = np.take_along_axis(block, candidates, axis=1)
+    order = np.argsort(-candidate_similarity, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)[:, :k]
+    weights = np.take_along_axis(candidate_similarity, order, axis=1)[:, :k]
+    return indices, weights
+
+
+def top_k_cosine_neighbours(
+    ratings: csr_matrix,
+    k: int,
+    block_size: int,
+    rows: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Поблочный поиск top-k соседей по косинусному сходству.
+
+    Сходство считается для блоков по ``block_size`` пользователей против
+    всей матрицы, так что в памяти одновременно находится не больше
+    ``block_size x n_users`` значений вместо полной матрицы ``n_users^2``.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param k: int - сколько соседей оставить
+    :param block_size: int - количество пользователей в блоке
+    :param rows: np.ndarray | None - для каких строк искать соседей
+        (по умолчанию для всех)
+    :return: индексы соседей и их similarity (``len(rows) x k``),
+        отсортированные по убыванию
+    """
+    n_users = ratings.shape[0]
+    if rows is None:
+        rows = np.arange(n_users)
+    k = max(min(k, n_users - 1), 0)
+    indices = np.empty((len(rows), k), dtype=np.int64)
+    weights = np.empty((len(rows), k), dtype=np.float64)
+    # нормировка строк один раз: сходство блока -- скалярное произведение
+    normalized = _normalize_rows(ratings)
+    normalized_t = normalized.T.tocsc()
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start : start + block_size]
+        block = (normalized[block_rows] @ normalized_t).toarray()
+        (
+            indices[start : start + block_size],
+            weights[start : start + block_size],
+        ) = select_top_k(block, k, self_columns=block_rows)
+        del block
+    return indices, weights
+
+
+def top_k_neighbours(
+    ratings: csr_matrix,
+    k: int,
+    block_size: int,
+    rows: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Поиск top-k соседей способом из настроек.
+
+    Приближенный поиск (similarity_index = approximate) используется
+    только для матриц от approximate_min_rows строк, на меньших поиск
+    всегда точный.
+
+    :return: индексы соседей и их similarity, отсортированные по убыванию
+    """
+    if is_approximate_search(ratings.shape[0]):
+        return approximate_top_k_neighbours(
+            ratings,
+            k,
+            block_size,
+            rows,
+            lists=settings.approximate_lists,
+            probes=settings.approximate_probes,
+        )
+    return top_k_cosine_neighbours(ratings, k, block_size, rows)
+
+
+def is_approximate_search(n_rows: int) -> bool:
+    """Ищутся ли соседи для матрицы из ``n_rows`` строк приближенно."""
+    return (
+        settings.similarity_index == "approximate"
+        and n_rows >= settings.approximate_min_rows
+    )
+
+
+def approximate_top_k_neighbours(
+    ratings: csr_matrix,
+    k: int,
+    block_size: int,
+    rows: np.ndarray | None = None,
+    lists: int = 0,
+    probes: int = 16,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Приближенный поиск top-k соседей по косинусному сходству (IVF).
+
+    Строки разбиваются на ``lists`` кластеров сферическим k-means, и
+    соседи каждой строки ищутся только среди строк ``probes`` ближайших
+    к ней кластеров. Сходство с ними считается точно, поэтому
+    similarity соседей точные, приближен только их выбор. При
+    ``lists ~ sqrt(n_rows)`` стоимость -- ``O(n_rows^1.5 * probes)``
+    сравнений вместо ``O(n_rows^2)``; центроиды занимают
+    ``lists x n_columns`` значений.
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param k: int - сколько соседей оставить
+    :param block_size: int - строк в блоке при расчете кластеров
+    :param rows: np.ndarray | None - для каких строк искать соседей
+        (по умолчанию для всех)
+    :param lists: int - количество кластеров (0 -- корень из числа строк)
+    :param probes: int - сколько ближайших кластеров просматривать
+    :param seed: int - начальное значение генератора центроидов
+    :return: индексы соседей и их similarity (``len(rows) x k``),
+        отсортированные по убыванию
+    """
+    n_users = ratings.shape[0]
+    if rows is None:
+        rows = np.arange(n_users)
+    k = max(min(k, n_users - 1), 0)
+    lists = min(lists or max(int(np.sqrt(n_users)), 1), n_users)
+    probes = max(min(probes, lists), 1)
+    normalized = _normalize_rows(ratings)
+    centroids = _cluster_rows(normalized, lists, block_size, seed)
+    assignment = np.empty(n_users, dtype=np.int64)
+    nearest = np.empty((len(rows), probes), dtype=np.int64)
+    for start in range(0, n_users, block_size):
+        assignment[start : start + block_size] = np.argmax(
+            normalized[start : start + block_size] @ centroids.T, axis=1
+        )
+    for start in range(0, len(rows), block_size):
+        block = normalized[rows[start : start + block_size]] @ centroids.T
+        nearest[start : start + block_size] = np.argpartition(
+            -block, probes - 1, axis=1
+        )[:, :probes]
+
+    # строки каждого кластера и строки, которые его просматривают
+    members = np.argsort(assignment, kind="stable")
+    member_bounds = np.searchsorted(assignment[members], np.arange(lists + 1))
+    queries = np.argsort(nearest.ravel(), kind="stable")
+    query_bounds = np.searchsorted(
+        nearest.ravel()[queries], np.arange(lists + 1)
+    )
+    queries //= probes
+    indices = np.full((len(rows), k), -1, dtype=np.int64)
+    weights = np.full((len(rows), k), -np.inf)
+    for cluster in range(lists):
+        cluster_rows = members[
+            member_bounds[cluster] : member_bounds[cluster + 1]
+        ]
+        cluster_queries = queries[
+            query_bounds[cluster] : query_bounds[cluster + 1]
+        ]
+        if not len(cluster_rows):
+            continue
+        cluster_t = normalized[cluster_rows].T.tocsc()
+        # строки, просматривающие кластер, -- блоками по block_size: в
+        # памяти не больше block_size x (k + размер кластера) значений
+        for start in range(0, len(cluster_queries), block_size):
+            positions = cluster_queries[start : start + block_size]
+            _merge_cluster(
+                indices,
+                weights,
+                positions,
+                rows[positions],
+                cluster_rows,
+                (normalized[rows[positions]] @ cluster_t).toarray(),
+                k,
+            )
+    # строкам, у которых в просмотренных кластерах меньше k соседей,
+    # соседи ищутся точно
+    incomplete = np.flatnonzero(indices.min(axis=1, initial=0) < 0)
+    if len(incomplete):
+        indices[incomplete], weights[incomplete] = top_k_cosine_neighbours(
+            ratings, k, block_size, rows=rows[incomplete]
+        )
+    return indices, weights
+
+
+def _merge_cluster(
+    indices: np.ndarray,
+    weights: np.ndarray,
+    positions: np.ndarray,
+    query_rows: np.ndarray,
+    cluster_rows: np.ndarray,
+    similarity: np.ndarray,
+    k: int,
+) -> None:
+    """Объединение найденных соседей строк ``positions`` с членами
+    кластера (``indices`` и ``weights`` обновляются на месте)."""
+    # исключаем саму строку
+    similarity[query_rows[:, None] == cluster_rows] = -np.inf
+    # объединяем только строки, у которых нашлись соседи лучше
+    better = (similarity > weights[positions, -1:]).any(axis=1)
+    positions = positions[better]
+    candidates = np.hstack(
+        [
+            indices[positions],
+            np.broadcast_to(cluster_rows, (len(positions), len(cluster_rows))),
+        ]
+    )
+    selected, weights[positions] = select_top_k(
+        np.hstack([weights[positions], similarity[better]]), k
+    )
+    indices[positions] = np.take_along_axis(candidates, selected, axis=1)
+
+
+def _cluster_rows(
+    normalized: csr_matrix, lists: int, block_size: int, seed: int
+) -> np.ndarray:
+    """Центроиды сферического k-means по нормированным строкам
+    (``lists x n_columns``, нормированы)."""
+    n_rows = normalized.shape[0]
+    rng = np.random.default_rng(seed)
+    centroids = normalized[
+        np.sort(rng.choice(n_rows, lists, replace=False))
+    ].toarray()
+    assignment = np.empty(n_rows, dtype=np.int64)
+    for _ in range(IVF_KMEANS_ITERATIONS):
+        for start in range(0, n_rows, block_size):
+            assignment[start : start + block_size] = np.argmax(
+                normalized[start : start + block_size] @ centroids.T, axis=1
+            )
+        # центроид -- сумма строк кластера, приведенная к единичной норме
+        centroids = (
+            csr_matrix(
+                (np.ones(n_rows), (assignment, np.arange(n_rows))),
+                shape=(lists, n_rows),
+            )
+            @ normalized
+        ).toarray()
+        centroids /= np.maximum(
+            np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12
+        )
+    return centroids
+
+
+def neighbour_recall(
+    ratings: csr_matrix,
+    neighbours: np.ndarray,
+    weights: np.ndarray,
+    sample: int,
+    block_size: int,
+    seed: int = 0,
+) -> float:
+    """Оценка recall@K найденных соседей по сравнению с точным поиском.
+
+    Для ``sample`` случайных строк -- доля соседей, similarity которых
+    не меньше k-го точного соседа (соседи с равным сходством
+    взаимозаменяемы).
+
+    :param ratings: csr_matrix - матрица "пользователь-фильм"
+    :param neighbours: np.ndarray - найденные соседи (``n_rows x k``)
+    :param weights: np.ndarray - их similarity
+    :param sample: int - сколько строк сравнить
+    :param block_size: int - строк в блоке при точном поиске
+    :param seed: int - начальное значение генератора выборки
+    :return: float - средний recall@K по выборке
+    """
+    n_rows, k = neighbours.shape
+    if not k or not n_rows or sample <= 0:
+        return 1.0
+    rows = np.sort(
+        np.random.default_rng(seed).choice(
+            n_rows, min(sample, n_rows), replace=False
+        )
+    )
+    _, exact_weights = top_k_cosine_neighbours(
+        ratings, k, block_size, rows=rows
+    )
+    # точные similarity соседей могут отличаться в последних разрядах
+    threshold = exact_weights[:, -1:] - 1e-9
+    hits = (np.asarray(weights)[rows] >= threshold).sum(axis=1)
+    return float(np.minimum(hits, k).mean() / k)
+
+
+def update_top_k_neighbours(
+    ratings: csr_matrix,
+    previous_neighbours: np.ndarray,
+    previous_weights: np.ndarray,
+    changed: np.ndarray,
+    k: int,
+    block_size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Пересчет top-k соседей после изменения части строк матрицы.
+
+    Полностью пересчитываются только пользователи, чей вектор изменился,
+    и те, у кого в списке соседей был измененный или удаленный
+    пользователь. Для остальных сходство со старыми соседями прежнее,
+    поэтому достаточно сравнить их список с измененными пользователями.
+    При точном поиске результат совпадает с полным пересчетом (с
+    точностью до порядка равных similarity).
+
+    :param ratings: csr_matrix - новая матрица "пользователь-фильм"
+    :param previous_neighbours: np.ndarray - прежние соседи в индексах
+        новой матрицы (-1 -- пользователь удален или новый)
+    :param previous_weights: np.ndarray - прежние similarity
+    :param changed: np.ndarray - маска строк, вектор которых изменился
+    :param k: int - сколько соседей оставить
+    :param block_size: int - количество пользователей в блоке
+    :return: индексы соседей и их similarity (``n_users x k``)
+    """
+    n_users = ratings.shape[0]
+    k = max(min(k, n_users - 1), 0)
+    if previous_neighbours.shape != (n_users, k):
+        return top_k_neighbours(ratings, k, block_size)
+    changed_rows = np.flatnonzero(changed)
+    stale = changed | (
+        (previous_neighbours < 0) | changed[np.maximum(previous_neighbours, 0)]
+    ).any(axis=1)
+    indices = np.array(previous_neighbours, dtype=np.int64)
+    weights = np.array(previous_weights, dtype=np.float64)
+
+    stale_rows = np.flatnonzero(stale)
+    if len(stale_rows):
+        indices[stale_rows], weights[stale_rows] = top_k_neighbours(
+            ratings, k, block_size, rows=stale_rows
+        )
+    fresh_rows = np.flatnonzero(~stale)
+    if not len(changed_rows) or not len(fresh_rows):
+        return indices, weights
+
+    # сходство остальных пользователей с измененными
+    normalized = _normalize_rows(ratings)
+    changed_t = normalized[changed_rows].T.tocsc()
+    for start in range(0, len(fresh_rows), block_size):
+        block_rows = fresh_rows[start : start + block_size]
+        candidates = np.hstack(
+            [
+                indices[block_rows],
+                np.tile(changed_rows, (len(block_rows), 1)),
+            ]
+        )
+        candidate_weights = np.hstack(
+            [
+                weights[block_rows],
+                (normalized[block_rows] @ changed_t).toarray(),
+            ]
+        )
+        positions, weights[block_rows] = select_top_k(candidate_weights, k)
+        indices[block_rows] = np.take_along_axis(candidates, positions, axis=1)
+    return indices, weights
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from core.config import settings
+from services.matrix import RatingMatrix
+
+# Версия формата бинарного снимка на диске
+SNAPSHOT_FORMAT = 5
+MANIFEST_FILE = "manifest.json"
+
+# Алгоритмы рекомендаций (settings.recommendations_engine): по похожим
+# пользователям, по фильмам, похожим на оцененные пользователем, и по
+# латентным факторам матричной факторизации
+USER_USER = "user_user"
+ITEM_ITEM = "item_item"
+ALS = "als"
+
+
+def _empty_neighbours() -> np.ndarray:
+    return np.empty((0, 0), dtype=np.int64)
+
+
+def _empty_weights() -> np.ndarray:
+    return np.empty((0, 0), dtype=np.float64)
+
+
+def _empty_factors() -> np.ndarray:
+    return np.empty((0, 0), dtype=np.float32)
+
+
+@dataclass(frozen=True)
+class MatrixSnapshot:
+    """Неизменяемый снимок матриц рекомендательной модели.
+
+    ``engine`` -- алгоритм, которым построена модель. Для user_user
+    ``neighbours`` и ``neighbour_weights`` -- матрицы ``n_users x k``
+    с индексами соседей (строками ``rating_matrix``) и их similarity,
+    отсортированными по убыванию; для item_item так же устроены
+    ``movie_neighbours`` и ``movie_neighbour_weights`` (``n_movies x k``,
+    индексы -- столбцы ``rating_matrix``); для als ``user_factors`` и
+    ``movie_factors`` -- латентные факторы строк и столбцов
+    ``rating_matrix`` (``n x factors``). Массивы других алгоритмов пусты.
+    ``best_movies`` -- UUID фильмов по убыванию среднего рейтинга,
+    ``new_movies`` -- UUID фильмов без оценок, ``fallback_movies`` --
+    рекомендации пользователям, которых нет в модели.
+    """
+
+    version: str | None
+    rating_matrix: RatingMatrix
+    best_movies: np.ndarray
+    new_movies: np.ndarray
+    fallback_movies: np.ndarray
+    engine: str = USER_USER
+    neighbours: np.ndarray = field(default_factory=_empty_neighbours)
+    neighbour_weights: np.ndarray = field(default_factory=_empty_weights)
+    movie_neighbours: np.ndarray = field(default_factory=_empty_neighbours)
+    movie_neighbour_weights: np.ndarray = field(default_factory=_empty_weights)
+    user_factors: np.ndarray = field(default_factory=_empty_factors)
+    movie_factors: np.ndarray = field(default_factory=_empty_factors)
+
+    def user_row(self, user_id: str) -> int:
+        return self.rating_matrix.user_row(user_id)
+
+    def has_user(self, user_id: str) -> bool:
+        """Есть ли у пользователя оценки в модели."""
+        try:
+            self.user_row(user_id)
+        except KeyError:
+            return False
+        return True
+
+    def best_movies_list(self) -> list[str]:
+        """Лучшие фильмы, которыми может дополняться список рекомендаций."""
+        return self.best_movies[: settings.num_recommendations].tolist()
+
+    def new_movies_list(self) -> list[str]:
+        """Новинки, которыми может дополняться список рекомендаций."""
+        return self.new_movies[: settings.num_recommendations].tolist()
+
+    @cached_property
+    def movie_similarity(self) -> csr_matrix:
+        """Похожие фильмы (item_item) как разреженная матрица
+        ``n_movies x n_movies``; строится один раз на снимок."""
+        n_movies, k = self.movie_neighbours.shape
+        return csr_matrix(
+            (
+                np.ravel(self.movie_neighbour_weights),
+                np.ravel(self.movie_neighbours),
+                np.arange(0, n_movies * k + 1, k),
+            ),
+            shape=(n_movies, self.rating_matrix.shape[1]),
+        )
+
+
+class SnapshotHolder:
+    """Текущий снимок матриц процесса.
+
+    Снимок подменяется целиком одной операцией присваивания, поэтому
+    запросы, уже получившие ссылку на старый снимок, дорабатывают с ним.
+    ``refresh_task`` -- фоновая сверка версии и загрузка нового снимка,
+    ``lock`` -- под ним загружается снимок и публикуется новая версия.
+    """
+
+    def __init__(self) -> None:
+        self.snapshot: MatrixSnapshot | None = None
+        self.checked_at: float = 0.0
+        self.lock = asyncio.Lock()
+        self.refresh_task: asyncio.Task | None = None
+
+    def is_stale(self) -> bool:
+        """Пора ли сверить версию снимка с хранилищем."""
+        return (
+            self.snapshot is None
+            or time.monotonic() - self.checked_at
+            >= settings.snapshot_check_interval
+        )
+
+    def swap(self, snapshot: MatrixSnapshot) -> None:
+        self.snapshot = snapshot
+        self.checked_at = time.monotonic()
+
+    def mark_checked(self) -> None:
+        self.checked_at = time.monotonic()
+
+
+def _snapshot_arrays(snapshot: MatrixSnapshot) -> dict[str, np.ndarray]:
+    """Массивы снимка в том виде, в котором они лежат на диске."""
+    ratings = snapshot.rating_matrix.ratings
+    return {
+        "ratings_data": ratings.data,
+        "ratings_indices": ratings.indices,
+        "ratings_indptr": ratings.indptr,
+        "user_ids": snapshot.rating_matrix.user_ids,
+        "movie_ids": snapshot.rating_matrix.movie_ids,
+        "neighbours": snapshot.neighbours,
+        "neighbour_weights": snapshot.neighbour_weights,
+        "movie_neighbours": snapshot.movie_neighbours,
+        "movie_neighbour_weights": snapshot.movie_neighbour_weights,
+        "user_factors": snapshot.user_factors,
+        "movie_factors": snapshot.movie_factors,
+        "best_movies": snapshot.best_movies,
+        "new_movies": snapshot.new_movies,
+        "fallback_movies": snapshot.fallback_movies,
+    }
+
+
+def save_snapshot(snapshot: MatrixSnapshot, directory: str) -> str:
+    """Сохранение снимка в ``directory/<version>`` в формате .npy.
+
+    Файлы пишутся во временный каталог, который затем атомарно
+    переименовывается, так что читатели видят либо полный снимок, либо
+    ничего. Хранятся только последние ``snapshot_keep_versions`` версий.
+
+    :return: str - путь к каталогу снимка
+    """
+    path = os.path.join(directory, snapshot.version)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    arrays = _snapshot_arrays(snapshot)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": snapshot.version,
+        "engine": snapshot.engine,
+        "shape": list(snapshot.rating_matrix.shape),
+        "nnz": snapshot.rating_matrix.nnz,
+        "arrays": {
+            name: {"dtype": str(array.dtype), "shape": list(array.shape)}
+            for name, array in arrays.items()
+        },
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, path)
+    _remove_old_snapshots(directory, settings.snapshot_keep_versions)
+    return path
+
+
+def load_snapshot(directory: str, version: str) -> MatrixSnapshot | None:
+    """Загрузка снимка версии ``version`` через np.load(mmap_mode="r").
+
+    Массивы отображаются в память, поэтому все процессы на машине делят
+    одну копию страниц из page cache, а загрузка не зависит от размера
+    модели.
+
+    :return: MatrixSnapshot | None - None, если снимка на диске нет
+    """
+    path = os.path.join(directory, version)
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in manifest["arrays"]
+    }
+    ratings = csr_matrix(
+        (
+            arrays["ratings_data"],
+            arrays["ratings_indices"],
+            arrays["ratings_indptr"],
+        ),
+        shape=tuple(manifest["shape"]),
+        copy=False,
+    )
+    return MatrixSnapshot(
+        version=manifest["version"],
+        rating_matrix=RatingMatrix(
+            user_ids=arrays["user_ids"],
+            movie_ids=arrays["movie_ids"],
+            ratings=ratings,
+        ),
+        best_movies=arrays["best_movies"],
+        new_movies=arrays["new_movies"],
+        fallback_movies=arrays["fallback_movies"],
+        engine=manifest["engine"],
+        neighbours=arrays["neighbours"],
+        neighbour_weights=arrays["neighbour_weights"],
+        movie_neighbours=arrays["movie_neighbours"],
+        movie_neighbour_weights=arrays["movie_neighbour_weights"],
+        user_factors=arrays["user_factors"],
+        movie_factors=arrays["movie_factors"],
+    )
+
+
+def _remove_old_snapshots(directory: str, keep: int) -> None:
+    """Удаление всех снимков, кроме ``keep`` последних версий.
+
+    Отображенные в память файлы остаются доступны процессам, которые
+    их еще используют, до закрытия отображения.
+    """
+    if keep <= 0:
+        return
+    versions = sorted(
+        name
+        for name in os.listdir(directory)
+        if not name.endswith(".tmp")
+        and os.path.isfile(os.path.join(directory, name, MANIFEST_FILE))
+    )
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+snapshot_holder = SnapshotHolder()
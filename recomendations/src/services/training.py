@@ -0,0 +1,360 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable
+
+import bson
+import numpy as np
+from bson.raw_bson import RawBSONDocument
+
+from core.config import settings
+from services import metrics
+from services.factorization import train_als
+from services.matrix import (
+    RatingMatrix,
+    RatingTriples,
+    find_positions,
+    merge_movie_ratings,
+)
+from services.scoring import get_movies_uuid
+from services.similarity import (
+    is_approximate_search,
+    neighbour_recall,
+    top_k_neighbours,
+    update_top_k_neighbours,
+)
+from services.snapshot import ALS, ITEM_ITEM, USER_USER, MatrixSnapshot
+
+# Модель: матрица "пользователь-фильм" и массивы выбранного алгоритма
+# (поля MatrixSnapshot с теми же именами)
+Model = tuple[RatingMatrix, dict[str, np.ndarray]]
+
+# Пул процессов для CPU-операций обновления матриц; создается при запуске
+# приложения. Если пула нет, операции выполняются в потоке.
+executor: Executor | None = None
+
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any) -> Any:
+    """Выполнение CPU-операции вне цикла событий.
+
+    Аргументы и результат передаются между процессами через pickle,
+    поэтому ``func`` должна быть функцией верхнего уровня модуля.
+    """
+    if executor is None:
+        return await asyncio.to_thread(func, *args)
+    loop = asyncio.get_running_loop()
+    result, peak_rss = await loop.run_in_executor(
+        executor, _call_with_peak_rss, func, *args
+    )
+    metrics.record_worker_peak_rss(peak_rss)
+    return result
+
+
+def _call_with_peak_rss(func: Callable[..., Any], *args: Any) -> tuple:
+    """Результат ``func`` и пиковый RSS процесса пула во время вызова."""
+    metrics.reset_peak_rss()
+    return func(*args), metrics.peak_rss()
+
+
+def build_model(
+    triples: RatingTriples,
+    top_k: int,
+    block_size: int,
+    engine: str = USER_USER,
+) -> Model | None:
+    """Полное построение модели по всем оценкам.
+
+    Параметры ALS берутся из настроек als_*.
+
+    :param triples: RatingTriples - оценки пользователей
+    :param top_k: int - сколько соседей хранить (0 -- всех)
+    :param block_size: int - строк в блоке при расчете сходства или
+        пересчете факторов
+    :param engine: str - алгоритм рекомендаций
+    :return: Model | None - None, если оценок нет
+    """
+    # Создание разреженной матрицы "пользователь-фильм"
+    rating_matrix = triples.to_matrix()
+    if not rating_matrix.nnz:
+        return None
+    if engine == ALS:
+        # Латентные факторы пользователей и фильмов: модель занимает
+        # (n_users + n_movies) x als_factors значений
+        user_factors, movie_factors = train_als(
+            rating_matrix.ratings,
+            settings.als_factors,
+            settings.als_iterations,
+            settings.als_regularization,
+            settings.als_alpha,
+            block_size,
+        )
+        return rating_matrix, {
+            "user_factors": user_factors,
+            "movie_factors": movie_factors,
+        }
+    if engine == ITEM_ITEM:
+        # Поблочное вычисление косинусного сходства между фильмами
+        # (столбцами матрицы): для каждого оставляем top-K похожих
+        movie_ratings = rating_matrix.ratings.T.tocsr()
+        neighbours, weights = top_k_neighbours(
+            movie_ratings, top_k or movie_ratings.shape[0], block_size
+        )
+        return rating_matrix, {
+            "movie_neighbours": neighbours,
+            "movie_neighbour_weights": weights,
+        }
+    # Поблочное вычисление косинусного сходства между пользователями:
+    # для каждого оставляем top-K соседей по убыванию similarity
+    neighbours, weights = top_k_neighbours(
+        rating_matrix.ratings,
+        top_k or rating_matrix.shape[0],
+        block_size,
+    )
+    return rating_matrix, {
+        "neighbours": neighbours,
+        "neighbour_weights": weights,
+    }
+
+
+def update_model(
+    snapshot: MatrixSnapshot,
+    changed_movies: list[str],
+    delta: RatingTriples,
+    top_k: int,
+    block_size: int,
+) -> tuple[Model, int]:
+    """Обновление модели по фильмам, лайки которых изменились.
+
+    Алгоритм модели -- алгоритм снимка.
+
+    :param snapshot: MatrixSnapshot - текущая модель
+    :param changed_movies: list[str] - фильмы с измененными лайками
+    :param delta: RatingTriples - все оценки измененных фильмов
+    :param top_k: int - сколько соседей хранить (0 -- всех)
+    :param block_size: int - строк в блоке при расчете сходства
+    :return: новая модель и количество затронутых пользователей (для
+        item_item -- фильмов)
+    """
+    rating_matrix, changed, previous_to_current = merge_movie_ratings(
+        snapshot.rating_matrix, changed_movies, delta.to_matrix()
+    )
+    if snapshot.engine == ITEM_ITEM:
+        # сходство двух фильмов зависит только от их столбцов, поэтому
+        # изменились только столбцы измененных фильмов
+        movie_ratings = rating_matrix.ratings.T.tocsr()
+        changed = np.isin(rating_matrix.movie_ids, list(changed_movies))
+        neighbours, weights = _update_neighbours(
+            movie_ratings,
+            snapshot.movie_neighbours,
+            snapshot.movie_neighbour_weights,
+            find_positions(
+                rating_matrix.movie_ids, snapshot.rating_matrix.movie_ids
+            ),
+            changed,
+            top_k,
+            block_size,
+        )
+        arrays = {
+            "movie_neighbours": neighbours,
+            "movie_neighbour_weights": weights,
+        }
+    else:
+        neighbours, weights = _update_neighbours(
+            rating_matrix.ratings,
+            snapshot.neighbours,
+            snapshot.neighbour_weights,
+            previous_to_current,
+            changed,
+            top_k,
+            block_size,
+        )
+        arrays = {"neighbours": neighbours, "neighbour_weights": weights}
+    return (rating_matrix, arrays), int(changed.sum())
+
+
+def _update_neighbours(
+    ratings,
+    previous_neighbours: np.ndarray,
+    previous_weights: np.ndarray,
+    previous_to_current: np.ndarray,
+    changed: np.ndarray,
+    top_k: int,
+    block_size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Пересчет top-k соседей строк ``ratings`` по прежним соседям.
+
+    :param previous_to_current: np.ndarray - номер строки в новой матрице
+        для каждой прежней строки (-1 -- строки больше нет)
+    """
+    # прежние соседи в индексах новой матрицы
+    n_rows, n_neighbours = ratings.shape[0], previous_neighbours.shape[1]
+    neighbours = np.full((n_rows, n_neighbours), -1)
+    weights = np.zeros((n_rows, n_neighbours))
+    present = previous_to_current >= 0
+    neighbours[previous_to_current[present]] = previous_to_current[
+        previous_neighbours[present]
+    ]
+    weights[previous_to_current[present]] = previous_weights[present]
+    return update_top_k_neighbours(
+        ratings,
+        neighbours,
+        weights,
+        changed,
+        top_k or n_rows,
+        block_size,
+    )
+
+
+def is_approximate_model(model: Model, engine: str) -> bool:
+    """Найдены ли соседи модели приближенным поиском."""
+    rating_matrix, _ = model
+    if engine == ALS:
+        return False
+    if engine == ITEM_ITEM:
+        return is_approximate_search(rating_matrix.shape[1])
+    return is_approximate_search(rating_matrix.shape[0])
+
+
+def model_recall(
+    model: Model, engine: str, sample: int, block_size: int
+) -> float:
+    """recall@K соседей модели по сравнению с точным поиском на выборке
+    из ``sample`` строк."""
+    rating_matrix, arrays = model
+    if engine == ITEM_ITEM:
+        return neighbour_recall(
+            rating_matrix.ratings.T.tocsr(),
+            arrays["movie_neighbours"],
+            arrays["movie_neighbour_weights"],
+            sample,
+            block_size,
+        )
+    return neighbour_recall(
+        rating_matrix.ratings,
+        arrays["neighbours"],
+        arrays["neighbour_weights"],
+        sample,
+        block_size,
+    )
+
+
+def _encode(record: dict) -> RawBSONDocument:
+    """Документ в BSON.
+
+    Готовый BSON передается из процесса пула как байты: разбор миллионов
+    вложенных словарей в основном процессе блокировал бы цикл событий.
+    """
+    return RawBSONDocument(bson.encode(record))
+
+
+def build_records(
+    model: Model, engine: str = USER_USER
+) -> tuple[list[RawBSONDocument], list[RawBSONDocument]]:
+    """Документы коллекции user_movie_matrix и коллекции модели.
+
+    В user_movie_matrix у пользователя хранятся только ненулевые оценки:
+    ``{"_id": user_id, "movie_ids": [...], "ratings": [...]}``.
+
+    Для user_user это документы user_similarity, для item_item --
+    movie_similarity, для als -- факторы пользователей и фильмов
+    в model_factors (``_id`` -- ``user:<id>`` или ``movie:<id>``).
+    """
+    rating_matrix, arrays = model
+    user_ids = rating_matrix.user_ids.tolist()
+    movie_ids = rating_matrix.movie_ids.tolist()
+    # Документы коллекции user_movie_matrix: только ненулевые оценки
+    # пользователя параллельными массивами movie_ids и ratings
+    ratings = rating_matrix.ratings
+    user_movie_records = [
+        _encode(
+            {
+                "_id": user_id,
+                "movie_ids": rating_matrix.movie_ids[
+                    ratings.indices[start:stop]
+                ].tolist(),
+                "ratings": ratings.data[start:stop].tolist(),
+            }
+        )
+        for user_id, start, stop in zip(
+            user_ids, ratings.indptr[:-1], ratings.indptr[1:]
+        )
+    ]
+
+    if engine == ALS:
+        factor_records = [
+            _encode({"_id": f"{kind}:{row_id}", "factors": row.tolist()})
+            for kind, ids, factors in (
+                ("user", user_ids, arrays["user_factors"]),
+                ("movie", movie_ids, arrays["movie_factors"]),
+            )
+            for row_id, row in zip(ids, factors)
+        ]
+        return user_movie_records, factor_records
+
+    if engine == ITEM_ITEM:
+        # Преобразование в нужный формат для коллекции movie_similarity
+        similarity_records = [
+            _encode(
+                {
+                    "_id": movie_id,
+                    "similar_movies": [
+                        {
+                            "movie_id": movie_ids[other_movie],
+                            "similarity": float(similarity),
+                        }
+                        for other_movie, similarity in zip(row, row_weights)
+                    ],
+                }
+            )
+            for movie_id, row, row_weights in zip(
+                movie_ids,
+                arrays["movie_neighbours"],
+                arrays["movie_neighbour_weights"],
+            )
+        ]
+        return user_movie_records, similarity_records
+
+    # Преобразование в нужный формат для коллекции user_similarity
+    similarity_records = []
+    for user_id, row, row_weights in zip(
+        user_ids, arrays["neighbours"], arrays["neighbour_weights"]
+    ):
+        similarity_data = {
+            "_id": user_id,  # Устанавливаем user_id как _id
+            "similar_users": [],  # Список схожих пользователей и similarity
+        }
+        for other_user, similarity in zip(row, row_weights):
+            similarity_data["similar_users"].append(
+                {
+                    "user_id": user_ids[other_user],
+                    "similarity": float(similarity),
+                }
+            )
+        similarity_records.append(_encode(similarity_data))
+    return user_movie_records, similarity_records
+
+
+def build_recommendations_records(
+    snapshot: MatrixSnapshot,
+) -> list[RawBSONDocument]:
+    """Документы коллекции user_recommendations для всех пользователей.
+
+    Пользователи оцениваются блоками по ``batch_block_size`` одним
+    расчетом на блок, как в пакетных запросах рекомендаций.
+    """
+    best_movies_list = snapshot.best_movies_list()
+    new_movies_list = snapshot.new_movies_list()
+    user_ids = snapshot.rating_matrix.user_ids.tolist()
+    block_size = max(settings.batch_block_size, 1)
+    recommendations_records = []
+    for start in range(0, len(user_ids), block_size):
+        user_rows = np.arange(start, min(start + block_size, len(user_ids)))
+        movies_uuid_by_user = get_movies_uuid(
+            snapshot, user_rows, best_movies_list, new_movies_list
+        )
+        recommendations_records.extend(
+            _encode({"_id": user_ids[user_row], "movies": movies_uuid})
+            for user_row, movies_uuid in zip(
+                user_rows.tolist(), movies_uuid_by_user
+            )
+        )
+    return recommendations_records
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from core.config import settings
+from services.matrix import RatingTriples
+
+
+class UgcLikesParser:
+    """Инкрементальный разбор потока лайков фильмов из UGC.
+
+    UGC отдает NDJSON -- по строке ``{"_id", "likes", "likes_updated_at"}``
+    на фильм. Куски ответа разбираются по мере получения, оценки сразу
+    складываются в ``RatingTriples``.
+
+    ``high_water_mark`` -- с какого момента запрашивать лайки при
+    следующем инкрементальном обновлении: время начала чтения минус
+    ugc_high_water_mark_overlap (UGC отдает время в UTC без часового
+    пояса). Лайк, записанный во время чтения, может получить время
+    раньше, чем у уже полученного фильма, поэтому наибольшее время среди
+    полученных фильмов для отметки не подходит; запас покрывает
+    расхождение часов сервисов. Фильмы из перекрытия будут получены
+    повторно, это безопасно.
+    """
+
+    def __init__(self) -> None:
+        self.triples = RatingTriples()
+        # id всех полученных фильмов, в том числе без лайков
+        self.movie_ids: list[str] = []
+        started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.high_water_mark = (
+            started_at
+            - timedelta(seconds=settings.ugc_high_water_mark_overlap)
+        ).isoformat()
+        # куски незавершенной строки; склеиваются один раз, когда придет
+        # ее конец, а не при каждом куске (строка популярного фильма --
+        # мегабайты)
+        self._pending: list[bytes] = []
+
+    def feed(self, chunk: bytes) -> None:
+        """Разбор очередного куска ответа."""
+        if b"\n" not in chunk:
+            self._pending.append(chunk)
+            return
+        first, *lines, rest = chunk.split(b"\n")
+        self._pending.append(first)
+        self._parse_line(b"".join(self._pending))
+        for line in lines:
+            self._parse_line(line)
+        self._pending = [rest]
+
+    def close(self) -> None:
+        """Разбор последней строки, если она не завершена переводом строки."""
+        self._parse_line(b"".join(self._pending))
+        self._pending = []
+
+    def _parse_line(self, line: bytes) -> None:
+        if not line.strip():
+            return
+        movie = json.loads(line)
+        movie_id = movie["_id"]
+        self.movie_ids.append(movie_id)
+        for like in movie.get("likes") or []:
+            self.triples.append(like["user_id"], movie_id, like["rating"])
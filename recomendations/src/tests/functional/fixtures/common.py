@@ -3,7 +3,10 @@ import pytest
 from functional.settings import test_settings
 
 CREATE_MATRICES_SUB_PATH = "create_matrices"
+REFRESH_JOBS_SUB_PATH = "refresh_jobs"
+BATCH_SUB_PATH = "batch"
 USER_ID = "3c8d0006-d12b-450c-808e-4c5639f2fb4d"
+UNKNOWN_USER_ID = "00000000-0000-0000-0000-000000000000"
 
 
 @pytest.fixture
@@ -14,3 +17,25 @@ def recommendations_api_create_matrices_url():
 @pytest.fixture
 def recommendations_api_get_recommendations_url():
     return f"{test_settings.recommendations_api_base_url}/{USER_ID}"
+
+
+@pytest.fixture
+def recommendations_api_get_unknown_user_recommendations_url():
+    return f"{test_settings.recommendations_api_base_url}/{UNKNOWN_USER_ID}"
+
+
+@pytest.fixture
+def recommendations_api_refresh_jobs_url():
+    return (
+        f"{test_settings.recommendations_api_base_url}/{REFRESH_JOBS_SUB_PATH}"
+    )
+
+
+@pytest.fixture
+def recommendations_api_batch_url():
+    return f"{test_settings.recommendations_api_base_url}/{BATCH_SUB_PATH}"
+
+
+@pytest.fixture
+def recommendations_api_metrics_url():
+    return test_settings.metrics_api_url
@@ -14,3 +14,29 @@ async def test_create_matrices(recommendations_api_create_matrices_url):
             assert (
                 response.status == HTTPStatus.OK
             ), f"API response status is not {HTTPStatus.OK}"
+
+
+async def test_get_refresh_job(
+    recommendations_api_create_matrices_url,
+    recommendations_api_refresh_jobs_url,
+):
+    async with ClientSession() as session:
+        async with session.get(
+            recommendations_api_create_matrices_url
+        ) as response:
+            job = await response.json()
+
+        url = f"{recommendations_api_refresh_jobs_url}/{job['job_id']}"
+
+        async with session.get(url) as response:
+            assert (
+                response.status == HTTPStatus.OK
+            ), f"API response status is not {HTTPStatus.OK}"
+            body = await response.json()
+            assert body["job_id"] == job["job_id"]
+            assert body["status"] in (
+                "queued",
+                "running",
+                "succeeded",
+                "failed",
+            )
@@ -1,8 +1,11 @@
+import json
 from http import HTTPStatus
 
 import pytest
 from aiohttp import ClientSession
 
+from functional.fixtures.common import UNKNOWN_USER_ID, USER_ID
+
 pytestmark = pytest.mark.asyncio
 
 
@@ -17,3 +20,34 @@ async def test_get_recommendations(recommendations_api_get_recommendations_url):
             body = await response.json()
             assert isinstance(body, list)
             assert len(body) >= 0
+
+
+async def test_get_recommendations_cold_start(
+    recommendations_api_get_unknown_user_recommendations_url,
+):
+    async with ClientSession() as session:
+        url = f"{recommendations_api_get_unknown_user_recommendations_url}"
+
+        async with session.get(url) as response:
+            assert (
+                response.status == HTTPStatus.OK
+            ), f"API response status is not {HTTPStatus.OK}"
+            body = await response.json()
+            assert isinstance(body, list)
+            movies_uuid = [movie["uuid"] for movie in body]
+            assert len(movies_uuid) == len(set(movies_uuid))
+
+
+async def test_get_batch_recommendations(recommendations_api_batch_url):
+    async with ClientSession() as session:
+        url = f"{recommendations_api_batch_url}"
+        user_ids = [USER_ID, UNKNOWN_USER_ID]
+
+        async with session.post(url, json=user_ids) as response:
+            assert (
+                response.status == HTTPStatus.OK
+            ), f"API response status is not {HTTPStatus.OK}"
+            lines = (await response.text()).splitlines()
+            body = [json.loads(line) for line in lines]
+            assert [item["user_id"] for item in body] == user_ids
+            assert all(isinstance(item["movies"], list) for item in body)
@@ -0,0 +1,18 @@
+from http import HTTPStatus
+
+import pytest
+from aiohttp import ClientSession
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_get_metrics(recommendations_api_metrics_url):
+    async with ClientSession() as session:
+        async with session.get(recommendations_api_metrics_url) as response:
+            assert (
+                response.status == HTTPStatus.OK
+            ), f"API response status is not {HTTPStatus.OK}"
+            body = await response.json()
+            assert isinstance(body["serving"], dict)
+            assert {"hits", "misses", "size"} <= body["film_cache"].keys()
+            assert body["peak_rss"] > 0
@@ -1,4 +1,7 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 
 from models.films import MovieCreate, MovieInDb
 from services.films import FilmService, get_film_service
@@ -15,6 +18,20 @@ async def create_movie(
     return result
 
 
+@router.get("/likes", summary="Потоковое получение лайков фильмов")
+async def get_movies_likes(
+    film_service: FilmService = Depends(get_film_service),
+    updated_since: datetime = Query(
+        None,
+        description="Только фильмы, лайки которых менялись с этого момента",
+    ),
+):
+    return StreamingResponse(
+        film_service.stream_likes(updated_since),
+        media_type="application/x-ndjson",
+    )
+
+
 @router.get(
     "/{movie_id}", response_model=MovieInDb, summary="Получение фильма"
 )
@@ -38,8 +55,12 @@ async def get_movies(
     sort_order: str = Query(
         None, description="Направление сортировки (asc/desc)"
     ),
+    updated_since: datetime = Query(
+        None,
+        description="Только фильмы, лайки которых менялись с этого момента",
+    ),
 ):
-    result = await film_service.get_movies()
+    result = await film_service.get_movies(updated_since)
 
     filtered_items = [MovieInDb.model_validate(item) for item in result]
 
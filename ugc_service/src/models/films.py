@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel, computed_field
 
 from core.models import BaseInMongo
@@ -35,6 +37,7 @@ class MovieInDb(BaseInMongo):
     title: str
     reviews: list[Review] | None
     likes: list[Like] | None
+    likes_updated_at: datetime | None = None
 
     @computed_field
     def average_rating(self) -> float:
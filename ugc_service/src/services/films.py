@@ -1,5 +1,7 @@
+import json
+from datetime import datetime, timezone
 from fastapi import Depends
-from typing import Any
+from typing import Any, AsyncIterator
 
 from core.exceptions import ObjectDoesNotExistExeption, DuplicateObjectExeption
 from models.films import MovieCreate, MovieInDb
@@ -19,7 +21,10 @@ class FilmService:
     async def create_movie(self, movie: MovieCreate) -> MovieInDb:
         id = {"_id": movie.id}
         data = {
-            "$setOnInsert": movie.model_dump(),
+            "$setOnInsert": {
+                **movie.model_dump(),
+                "likes_updated_at": datetime.now(timezone.utc),
+            },
         }
         movie_id = await self.collection.upsert_one(id, data)
         if not movie_id:
@@ -27,10 +32,38 @@ class FilmService:
         movie_db = MovieInDb(_id=movie_id, **movie.model_dump())
         return movie_db
 
-    async def get_movies(self) -> list[dict[Any, Any]]:
-        movies = await self.collection.get_list({})
+    async def get_movies(
+        self, updated_since: datetime | None = None
+    ) -> list[dict[Any, Any]]:
+        filters = {}
+        if updated_since is not None:
+            filters = {"likes_updated_at": {"$gte": updated_since}}
+        movies = await self.collection.get_list(filters)
         return movies
 
+    async def stream_likes(
+        self, updated_since: datetime | None = None
+    ) -> AsyncIterator[str]:
+        """Лайки фильмов в формате NDJSON: по строке на фильм."""
+        filters = {}
+        if updated_since is not None:
+            filters = {"likes_updated_at": {"$gte": updated_since}}
+        projection = {"likes": 1, "likes_updated_at": 1}
+        async for movie in self.collection.iterate(filters, projection):
+            updated_at = movie.get("likes_updated_at")
+            yield (
+                json.dumps(
+                    {
+                        "_id": str(movie["_id"]),
+                        "likes": movie.get("likes") or [],
+                        "likes_updated_at": (
+                            updated_at.isoformat() if updated_at else None
+                        ),
+                    }
+                )
+                + "\n"
+            )
+
     async def delete_movie(self, movie_id):
         return await self.collection.delete_one(movie_id)
 
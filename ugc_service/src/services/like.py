@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from fastapi import Depends
 from pymongo.errors import DuplicateKeyError
 
@@ -20,11 +22,15 @@ class LikeService:
             raise ObjectDoesNotExistExeption
         try:
             id = {'_id': movie_id, 'likes.user_id': {'$ne': user_id}}
-            data = {'$addToSet': {'likes': like_db.model_dump()}}
+            data = {
+                '$addToSet': {'likes': like_db.model_dump()},
+                '$set': {'likes_updated_at': datetime.now(timezone.utc)},
+            }
             await self.collection.upsert_one(id, data)
         except DuplicateKeyError:
             id = {'_id': movie_id, 'likes.user_id': user_id}
             form_data = form_mongo_update_data(like_db, 'likes.$.')
+            form_data['likes_updated_at'] = datetime.now(timezone.utc)
             data = {'$set': form_data}
             await self.collection.upsert_one(id, data)
         return like_db
@@ -66,7 +72,10 @@ class LikeService:
 
     async def remove_like_from_movie(self, movie_id: str, user_id: str) -> str:
         filter_criteria = {'_id': movie_id}
-        update_data = {'$pull': {'likes': {'user_id': user_id}}}
+        update_data = {
+            '$pull': {'likes': {'user_id': user_id}},
+            '$set': {'likes_updated_at': datetime.now(timezone.utc)},
+        }
         return await self.collection.upsert_one(filter_criteria, update_data)
 
     async def remove_like_from_review(
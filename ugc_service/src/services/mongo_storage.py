@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
 
 from bson import ObjectId
 from fastapi import Depends
@@ -54,6 +55,22 @@ class AbstractStorage(ABC):
         """
         pass
 
+    @abstractmethod
+    def iterate(
+        self,
+        filters: dict,
+        projection: dict = {},
+    ) -> AsyncIterator[dict]:
+        """
+        Последовательно отдает документы коллекции по фильтру, не загружая
+        их все в память.
+
+        :param filters: dict - фильтр для поиска
+        :param projection: dict - возвращаемые поля документа
+        :return: AsyncIterator[dict] - документы коллекции
+        """
+        pass
+
     @abstractmethod
     async def get_by_id(
         self,
@@ -106,6 +123,12 @@ class MongoStorage(AbstractStorage):
         docs = await cursor.to_list(length=None)
         return docs
 
+    async def iterate(
+        self, filters: dict, projection: dict = {}
+    ) -> AsyncIterator[dict]:
+        async for doc in self.collection.find(filters, projection or None):
+            yield doc
+
     async def get_by_id(self, filters: dict, projection: dict = {}) -> dict:
         doc = await self.collection.find_one(filters, projection)
         return doc if doc else None